@@ -16,8 +16,10 @@
 # under the License.
 # pylint: disable=invalid-name, unused-argument, import-outside-toplevel, no-value-for-parameter
 """A set of passes to legalize some of operations for the NPU"""
-from typing import List, Type, Callable
+from typing import Any, Dict, List, Set, Tuple, Type, Callable, Optional, Union
+import functools
 import math
+import operator
 
 import numpy as np  # type: ignore
 
@@ -36,6 +38,106 @@ from tvm.relay.backend.contrib.ethosu import util
 from tvm.relay.op.contrib import ethosu as ethosu_patterns  # type: ignore
 
 
+_INT8_MIN, _INT8_MAX = -128, 127
+
+# NumPy dtypes of the tensor data types handled by the NPU, so that the rewriters
+# don't have to parse the dtype strings for every operator
+_NP_DTYPES = {dtype: np.dtype(dtype) for dtype in ("int8", "uint8", "int16", "int32")}
+
+# The data of the constants created for every legalized operator. NDArrays are never
+# modified once wrapped in a constant, so the data is shared, but every operator still
+# gets its own Constant node since the constants are extracted per node when lowering.
+_EMPTY_LUT = tvm.nd.array(np.zeros(0, dtype="int8"))
+_INT16_ONE = tvm.nd.array(np.ones([1, 1, 1, 1], dtype="int16"))
+
+
+def _empty_lut() -> relay.Constant:
+    """Create the LUT of the operators that don't use one"""
+    return relay.Constant(_EMPTY_LUT)
+
+
+def _get_called_names(func: relay.Function) -> Set[str]:
+    """Collect the names of the composite functions and of the operators present in the
+    function, so that passes can skip functions their rewriters would not change"""
+    names = set()
+
+    def visit(expr):
+        if isinstance(expr, relay.Function) and expr.attrs and "Composite" in expr.attrs:
+            names.add(str(expr.attrs["Composite"]))
+        elif isinstance(expr, relay.Call) and isinstance(expr.op, tvm.ir.Op):
+            names.add(expr.op.name)
+
+    relay.analysis.post_order_visit(func, visit)
+    return names
+
+
+def _has_composite(func: relay.Function, names: Set[str]) -> bool:
+    """Check whether the function calls a composite function with one of the given names"""
+    return not _get_called_names(func).isdisjoint(names)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_composite_pattern(composite_name: str, num_inputs: Optional[int] = 1) -> CallPattern:
+    """Get the pattern matching the calls to the composite function with the given name.
+    Patterns are immutable, so each of them is built once and shared by all the rewriters.
+    With num_inputs=None the pattern matches calls with any number of inputs."""
+    args = [None] if num_inputs is None else [wildcard() for _ in range(num_inputs)]
+    return (wildcard().has_attr({"Composite": composite_name}))(*args)
+
+
+def _legalize_functions(
+    mod: tvm.ir.IRModule,
+    rewriters: Union[DFPatternCallback, List[DFPatternCallback]],
+    composite_names: Optional[Set[str]] = None,
+) -> tvm.ir.IRModule:
+    """Apply the rewriters to every function of the module. When composite_names is given,
+    the functions that don't call any of these composite functions are left unchanged.
+
+    This is written as a module pass loop rather than as a relay function pass, since
+    function passes skip the functions with a "Compiler" attribute, which are exactly
+    the functions partitioned for the NPU. The functions are rewritten one after the
+    other, as the rewriter callbacks are Python code that holds the GIL and the
+    rewriters share their caches between functions."""
+    for global_var, func in mod.functions.items():
+        if composite_names is not None and not _has_composite(func, composite_names):
+            continue
+        new_func = rewrite(rewriters, func)
+        # Updating a function checks it for being malformed, which is only worth doing
+        # when the rewriters changed it
+        if not new_func.same_as(func):
+            mod.update_func(global_var, new_func)
+    return mod
+
+
+def _extract_activation(params, activation_map: Dict[str, str]) -> Tuple[str, int, int]:
+    """Get the NPU activation and its clip range for the activation fused into the
+    composite function described by params"""
+    if not params.activation:
+        return "NONE", 0, 0
+    activation = activation_map[params.activation.op.name]
+    if activation != "CLIP":
+        return activation, 0, 0
+    activation_attrs = params.activation.attrs
+    return activation, int(activation_attrs.a_min), int(activation_attrs.a_max)
+
+
+def _get_params(params_class: Type, func: relay.Function, params_cache: Dict[relay.Function, Any]):
+    """Parse the body of a composite function into params_class, reusing the parsed params
+    when the same composite function was already seen by the rewriter. The callbacks set
+    the input tensors of the params for every call site before using them, so sharing the
+    params between call sites is safe."""
+    params = params_cache.get(func)
+    if params is None:
+        params = params_class(func.body)
+        params_cache[func] = params
+    return params
+
+
+def _scalar(value: tvm.nd.NDArray):
+    """Extract the Python scalar held by a 0-d NDArray"""
+    return value.numpy().item()
+
+
 class SplitRewriter(DFPatternCallback):
     """This rewriting converts split operations into a sequence of
     strided_slice operations, because codegen is going to be based
@@ -44,7 +146,7 @@ class SplitRewriter(DFPatternCallback):
     """
 
     def __init__(self):
-        super().__init__(require_type=True)
+        super().__init__(require_type=True, rewrite_once=True)
         self.split_in = wildcard()
         self.pattern = is_op("split")(self.split_in)
 
@@ -68,13 +170,12 @@ class SplitRewriter(DFPatternCallback):
             begins
         """
         indices_or_sections = split.attrs.indices_or_sections
-        input_shape = split.args[0].checked_type.shape
-        split_axis = split.attrs.axis
 
         if isinstance(indices_or_sections, tvm.ir.container.Array):
             # 0 is the beginning of the first section.
             return [0] + list(indices_or_sections)
-        split_axis_len = input_shape[split_axis].value
+        # The input shape is only needed when splitting into equal sections
+        split_axis_len = split.args[0].checked_type.shape[split.attrs.axis].value
         section_length = split_axis_len // indices_or_sections.value
         return list(range(0, split_axis_len, section_length))
 
@@ -82,29 +183,25 @@ class SplitRewriter(DFPatternCallback):
         self, pre: tvm.relay.Expr, post: tvm.relay.Expr, node_map: tvm.ir.container.Map
     ) -> tvm.relay.Expr:
         split_input = post.args[0]
-        split_begins = list()
-        split_ends = list()
-        section_begins_in_split_axis = self.get_section_begin_coords(post)
-        for split_cord in section_begins_in_split_axis:
-            # first begin is [0, 0, ... , 0]
-            begin_shape = [0 for i in range(len(split_input.checked_type.shape))]
-            begin_shape[post.attrs.axis] = split_cord
-            split_begins.append(begin_shape)
-
-            end_shape = list(split_input.checked_type.shape)
-            # Only the split axis coordinate changes
-            end_shape[post.attrs.axis] = split_cord
-            split_ends.append(end_shape)
+        split_axis = int(post.attrs.axis)
+        input_shape = [int(dim) for dim in split_input.checked_type.shape]
+        section_begins_in_split_axis = [int(c) for c in self.get_section_begin_coords(post)]
+        num_sections = len(section_begins_in_split_axis)
+
+        # first begin is [0, 0, ... , 0] and only the split axis coordinate changes
+        split_begins = np.zeros((num_sections, len(input_shape)), dtype=np.int64)
+        split_begins[:, split_axis] = section_begins_in_split_axis
 
         # Coordinates needs to be shifted left because beginning
-        # of the next section is the end of the previous
-        split_ends = split_ends[1:]
+        # of the next section is the end of the previous.
         # Last section end is the shape of the tensor itself.
-        split_ends.append(list(split_input.checked_type.shape))
+        split_ends = np.tile(np.array(input_shape, dtype=np.int64), (num_sections, 1))
+        split_ends[:-1, split_axis] = section_begins_in_split_axis[1:]
 
-        strided_slices = list()
-        for sb, se in zip(split_begins, split_ends):
-            strided_slices.append(relay.strided_slice(split_input, sb, se))
+        strided_slices = [
+            relay.strided_slice(split_input, sb, se)
+            for sb, se in zip(split_begins.tolist(), split_ends.tolist())
+        ]
 
         return relay.Tuple(strided_slices)
 
@@ -116,30 +213,53 @@ class LegalizeSplit:
     def transform_module(
         self, mod: tvm.ir.IRModule, ctx: tvm.ir.transform.PassContext
     ) -> tvm.ir.IRModule:
-        for global_var, func in mod.functions.items():
-            func = rewrite(SplitRewriter(), func)
-            mod.update_func(global_var, func)
-        return mod
+        return _legalize_functions(mod, SplitRewriter())
 
     def __call__(self, *args, **kwargs):
         pass
 
 
 def get_lut_from_func(
-    ifm_scale: float, ifm_zp: int, ofm_scale: float, ofm_zp: int, func: Callable[[float], float]
-) -> List[int]:
-    """Method to calculate the values of the lookup table based on the calculation function"""
-    lut_values = list()
+    ifm_scale: float,
+    ifm_zp: int,
+    ofm_scale: float,
+    ofm_zp: int,
+    func: Callable[[float], float],
+    np_func: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+) -> np.ndarray:
+    """Method to calculate the values of the lookup table based on the calculation function.
+    The whole int8 input domain is evaluated at once, using np_func as the vectorized
+    equivalent of func when it is provided. The int8 results are returned reinterpreted
+    as the uint8 buffer expected by the LUT constant."""
     # Only int8 is currently supported
-    dtype = np.int8
-    qmin, qmax = np.iinfo(dtype).min, np.iinfo(dtype).max
-    for x in range(qmin, qmax + 1):
-        x_real = ifm_scale * (x - ifm_zp)
-        out_real = func(x_real)
-        lut_result = int(util.round_away_zero(ofm_zp + out_real / ofm_scale))
-        lut_result = min(qmax, max(qmin, lut_result))
-        lut_values.append(lut_result)
-
+    qmin, qmax = _INT8_MIN, _INT8_MAX
+    if np_func is None:
+        np_func = np.vectorize(func, otypes=[np.float64])
+    # The zero point is folded into the integer range and the remaining
+    # arithmetic is done in place to avoid temporaries
+    x_real = np.arange(qmin - ifm_zp, qmax - ifm_zp + 1, dtype=np.float64)
+    x_real *= ifm_scale
+    out_real = np.asarray(np_func(x_real), dtype=np.float64)
+    out_real /= ofm_scale
+    out_real += ofm_zp
+    lut_values = util.round_away_zero_array(out_real)
+    return np.clip(lut_values, qmin, qmax).astype(np.int8).view(np.uint8)
+
+
+@functools.lru_cache(maxsize=256)
+def _get_cached_lut(
+    ifm_scale: float,
+    ifm_zp: int,
+    ofm_scale: float,
+    ofm_zp: int,
+    func: Callable[[float], float],
+    np_func: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+) -> np.ndarray:
+    """Memoized get_lut_from_func, so that activations sharing the same quantization
+    parameters only compute their lookup table once"""
+    lut_values = get_lut_from_func(ifm_scale, ifm_zp, ofm_scale, ofm_zp, func, np_func)
+    # The cached table is shared between callers
+    lut_values.flags.writeable = False
     return lut_values
 
 
@@ -147,28 +267,33 @@ class LutActivationRewriter(DFPatternCallback):
     """A class to create an identity operator with the LUT"""
 
     def __init__(
-        self, params_class: Type, activation_type: str, calc_func: Callable[[float], float]
+        self,
+        params_class: Type,
+        activation_type: str,
+        calc_func: Callable[[float], float],
+        np_calc_func: Optional[Callable[[np.ndarray], np.ndarray]] = None,
     ):
         super().__init__(require_type=True, rewrite_once=True)
-        self.pattern = (wildcard().has_attr({"Composite": params_class.composite_name}))(wildcard())
+        self.pattern = _get_composite_pattern(params_class.composite_name)
         self.activation_type = activation_type
         self.calc_func = calc_func
+        self.np_calc_func = np_calc_func
 
     def callback(self, pre: tvm.relay.Expr, post: tvm.relay.Expr, node_map: tvm.ir.container.Map):
         id_input = post.args[0]
 
         quantize_args = post.op.body.args
-        output_scale = float(quantize_args[1].data.asnumpy())
-        output_zp = int(quantize_args[2].data.asnumpy())
+        output_scale = float(_scalar(quantize_args[1].data))
+        output_zp = int(_scalar(quantize_args[2].data))
 
         dequantize_args = quantize_args[0].args[0].args
-        input_scale = float(dequantize_args[1].data.asnumpy())
-        input_zp = int(dequantize_args[2].data.asnumpy())
+        input_scale = float(_scalar(dequantize_args[1].data))
+        input_zp = int(_scalar(dequantize_args[2].data))
 
-        lut_values = get_lut_from_func(
-            input_scale, input_zp, output_scale, output_zp, self.calc_func
+        lut_values = _get_cached_lut(
+            input_scale, input_zp, output_scale, output_zp, self.calc_func, self.np_calc_func
         )
-        lut = relay.const(lut_values, dtype="uint8")
+        lut = relay.const(lut_values)
 
         # We baked the requantization into the LUT, so we don't requantize the identity operator
         identity = ethosu_ops.ethosu_identity(
@@ -189,7 +314,12 @@ class TanhRewriter(LutActivationRewriter):
 
     def __init__(self):
         super().__init__(
-            params_class=ethosu_patterns.TanhParams, activation_type="TANH", calc_func=math.tanh
+            params_class=ethosu_patterns.TanhParams,
+            activation_type="TANH",
+            calc_func=math.tanh,
+            # Unlike the sigmoid, tanh has no exact saturation point, so the table is
+            # evaluated over the whole int8 domain rather than only between limits
+            np_calc_func=np.tanh,
         )
 
 
@@ -200,30 +330,37 @@ class LegalizeTanh:
     def transform_module(
         self, mod: tvm.ir.IRModule, ctx: tvm.ir.transform.PassContext
     ) -> tvm.ir.IRModule:
-        for global_var, func in mod.functions.items():
-            func = rewrite(TanhRewriter(), func)
-            mod.update_func(global_var, func)
-        return mod
+        return _legalize_functions(mod, TanhRewriter(), {ethosu_patterns.TanhParams.composite_name})
 
     def __call__(self, *args, **kwargs):
         pass
 
 
+# These limits are inherited from TFLite
+SIGMOID_LOWER_LIMIT = -8.0
+SIGMOID_UPPER_LIMIT = 8.0
+
+
 def sigmoid_calc_func(x: float) -> float:
     """Function to calculate the values for sigmoid"""
-    # Thse limits are inherited from TFLite
-    upper_limit = 8.0
-    lower_limit = -8.0
-
-    if x <= lower_limit:
+    if x <= SIGMOID_LOWER_LIMIT:
         y = 0.0
-    elif x >= upper_limit:
+    elif x >= SIGMOID_UPPER_LIMIT:
         y = 1.0
     else:
         y = 1 / (1 + math.exp(-x))
     return y
 
 
+def np_sigmoid_calc_func(x: np.ndarray) -> np.ndarray:
+    """Vectorized version of sigmoid_calc_func. The values outside of the limits saturate
+    to 0 and 1, so the sigmoid is only evaluated for the values between the limits."""
+    y = np.where(x >= SIGMOID_UPPER_LIMIT, 1.0, 0.0)
+    live = (x > SIGMOID_LOWER_LIMIT) & (x < SIGMOID_UPPER_LIMIT)
+    y[live] = 1 / (1 + np.exp(-x[live]))
+    return y
+
+
 class SigmoidRewriter(LutActivationRewriter):
     """This pass adds sigmoid as a LUT for identity op"""
 
@@ -232,6 +369,7 @@ class SigmoidRewriter(LutActivationRewriter):
             params_class=ethosu_patterns.SigmoidParams,
             activation_type="SIGMOID",
             calc_func=sigmoid_calc_func,
+            np_calc_func=np_sigmoid_calc_func,
         )
 
 
@@ -242,10 +380,9 @@ class LegalizeSigmoid:
     def transform_module(
         self, mod: tvm.ir.IRModule, ctx: tvm.ir.transform.PassContext
     ) -> tvm.ir.IRModule:
-        for global_var, func in mod.functions.items():
-            func = rewrite(SigmoidRewriter(), func)
-            mod.update_func(global_var, func)
-        return mod
+        return _legalize_functions(
+            mod, SigmoidRewriter(), {ethosu_patterns.SigmoidParams.composite_name}
+        )
 
     def __call__(self, *args, **kwargs):
         pass
@@ -254,45 +391,39 @@ class LegalizeSigmoid:
 class Conv2DRewriter(DFPatternCallback):
     """Convert conv2d related composite functions into ethosu_conv2d operators"""
 
+    channels_map = {"NHWC": 3}
+    kernel_size_map = {"HWIO": slice(0, 2), "OHWI": slice(1, 3), "HWOI": slice(0, 2)}
+    activation_map = {"clip": "CLIP"}
+    weight_to_ohwi_transform_map = {"HWIO": [3, 0, 1, 2]}
+
     def __init__(self):
-        super().__init__(require_type=True)
-        self.pattern = (wildcard().has_attr({"Composite": "ethos-u.qnn_conv2d"}))(wildcard())
+        super().__init__(require_type=True, rewrite_once=True)
+        self.params_cache = dict()
+        self.pattern = _get_composite_pattern(ethosu_patterns.QnnConv2DParams.composite_name)
 
     def callback(
         self, pre: tvm.relay.Expr, post: tvm.relay.Expr, node_map: tvm.ir.container.Map
     ) -> tvm.relay.Expr:
-        params = ethosu_patterns.QnnConv2DParams(post.op.body)
+        params = _get_params(ethosu_patterns.QnnConv2DParams, post.op, self.params_cache)
         params.ifm.tensor = post.args[0]
-        channels_map = {
-            "NHWC": 3,
-        }
-        if str(params.ofm.layout) not in channels_map.keys():
-            raise UnsupportedLayout(str(params.ofm.layout))
-        kernel_size_map = {
-            "HWIO": params.weights.shape[0:2],
-            "OHWI": params.weights.shape[1:3],
-            "HWOI": params.weights.shape[0:2],
-        }
-        if str(params.weights.layout) not in kernel_size_map.keys():
-            raise UnsupportedLayout(str(params.weights.layout))
-        activation_map = {"clip": "CLIP"}
-        weight_to_ohwi_transform_map = {"HWIO": [3, 0, 1, 2]}
+        ifm_layout = str(params.ifm.layout)
+        ofm_layout = str(params.ofm.layout)
+        weights_layout = str(params.weights.layout)
+        if ofm_layout not in self.channels_map.keys():
+            raise UnsupportedLayout(ofm_layout)
+        if weights_layout not in self.kernel_size_map.keys():
+            raise UnsupportedLayout(weights_layout)
         weights_values = params.weights.values
-        weights_values_ohwi = np.transpose(
-            weights_values, weight_to_ohwi_transform_map[str(params.weights.layout)]
+        # Make the transposed weights contiguous here so that relay.const
+        # wraps them without another copy
+        weights_values_ohwi = np.ascontiguousarray(
+            weights_values.transpose(self.weight_to_ohwi_transform_map[weights_layout])
         )
-        if params.activation:
-            activation = activation_map[params.activation.op.name]
-            clip_min = int(params.activation.attrs.a_min)
-            clip_max = int(params.activation.attrs.a_max)
-        else:
-            activation = "NONE"
-            clip_min = 0
-            clip_max = 0
+        activation, clip_min, clip_max = _extract_activation(params, self.activation_map)
         scale_bias = vela_api.pack_biases(
-            biases=params.biases.tensor.data.asnumpy(),
+            biases=params.biases.tensor.data.numpy(),
             ifm_scale=params.ifm.q_params.scale_f32,
-            ifm_dtype=np.dtype(params.ifm.dtype),
+            ifm_dtype=_NP_DTYPES[params.ifm.dtype],
             weight_scales=params.weights.q_params.scale_f32,
             ofm_scale=params.ofm.q_params.scale_f32,
             is_activation_tanh_or_sigmoid=activation in ["TANH", "SIGMOID"],
@@ -301,14 +432,14 @@ class Conv2DRewriter(DFPatternCallback):
             ifm=post.args[0],
             weight=relay.const(weights_values_ohwi, params.weights.values.dtype),
             scale_bias=relay.const(scale_bias, "uint8"),
-            lut=relay.const([], dtype="int8"),
+            lut=_empty_lut(),
             ifm_scale=float(params.ifm.q_params.scale_f32),
             ifm_zero_point=int(params.ifm.q_params.zero_point),
             weight_zero_point=int(params.weights.q_params.zero_point),
             ofm_scale=float(params.ofm.q_params.scale_f32),
             ofm_zero_point=int(params.ofm.q_params.zero_point),
-            kernel_shape=kernel_size_map[str(params.weights.layout)],
-            ofm_channels=params.ofm.shape[channels_map[str(params.ofm.layout)]],
+            kernel_shape=params.weights.shape[self.kernel_size_map[weights_layout]],
+            ofm_channels=params.ofm.shape[self.channels_map[ofm_layout]],
             strides=params.strides,
             padding=params.padding,
             dilation=params.dilation,
@@ -316,8 +447,8 @@ class Conv2DRewriter(DFPatternCallback):
             clip_min=clip_min,
             clip_max=clip_max,
             upscale="NONE",
-            ifm_layout=str(params.ifm.layout),
-            ofm_layout=str(params.ofm.layout),
+            ifm_layout=ifm_layout,
+            ofm_layout=ofm_layout,
         )
         return ethosu_conv2d
 
@@ -329,10 +460,9 @@ class LegalizeConv2D:
     def transform_module(
         self, mod: tvm.ir.IRModule, ctx: tvm.ir.transform.PassContext
     ) -> tvm.ir.IRModule:
-        for global_var, func in mod.functions.items():
-            func = rewrite(Conv2DRewriter(), func)
-            mod.update_func(global_var, func)
-        return mod
+        return _legalize_functions(
+            mod, Conv2DRewriter(), {ethosu_patterns.QnnConv2DParams.composite_name}
+        )
 
     def __call__(self, *args, **kwargs):
         pass
@@ -342,49 +472,43 @@ class DepthwiseConv2DRewriter(DFPatternCallback):
     """Convert ethosu.qnn_depthwise_conv2d composite functions to ethosu_depthwise_conv2d
     operators"""
 
+    channels_map = {"NHWC": 3}
+    kernel_shape_map = {"HWOI": slice(0, 2)}
+
     def __init__(self):
-        super().__init__(require_type=True)
-        self.pattern = (
-            wildcard().has_attr(
-                {"Composite": ethosu_patterns.QnnDepthwiseConv2DParams.composite_name}
-            )
-        )(wildcard())
+        super().__init__(require_type=True, rewrite_once=True)
+        self.params_cache = dict()
+        self.pattern = _get_composite_pattern(
+            ethosu_patterns.QnnDepthwiseConv2DParams.composite_name
+        )
 
     def callback(
         self, pre: tvm.relay.Expr, post: tvm.relay.Expr, node_map: tvm.ir.container.Map
     ) -> tvm.relay.Expr:
-        params = ethosu_patterns.QnnDepthwiseConv2DParams(post.op.body)
+        params = _get_params(ethosu_patterns.QnnDepthwiseConv2DParams, post.op, self.params_cache)
         params.ifm.tensor = post.args[0]
-        channels_map = {
-            "NHWC": 3,
-        }
-        if str(params.ofm.layout) not in channels_map.keys():
-            raise UnsupportedLayout(str(params.ofm.layout))
-        kernel_shape_map = {
-            "HWOI": params.weights.shape[0:2],
-        }
-        if str(params.weights.layout) not in kernel_shape_map.keys():
-            raise UnsupportedLayout(str(params.weights.layout))
+        ifm_layout = str(params.ifm.layout)
+        ofm_layout = str(params.ofm.layout)
+        weights_layout = str(params.weights.layout)
+        if ofm_layout not in self.channels_map.keys():
+            raise UnsupportedLayout(ofm_layout)
+        if weights_layout not in self.kernel_shape_map.keys():
+            raise UnsupportedLayout(weights_layout)
 
         weights_values = params.weights.values
-        weights_values_ohwi = np.moveaxis(weights_values, [0, 1, 2, 3], [1, 2, 0, 3])
+        weights_values_ohwi = np.ascontiguousarray(
+            np.moveaxis(weights_values, [0, 1, 2, 3], [1, 2, 0, 3])
+        )
 
-        activation = "NONE"
         # Activations requiring LUT is currently not supported, so setting it to an empty list
-        lut = relay.const([], "int8")
-        clip_min = 0
-        clip_max = 0
-        if params.activation:
-            activation = ethosu_patterns.QnnDepthwiseConv2DParams.activation_map[
-                params.activation.op.name
-            ]
-            if activation == "CLIP":
-                clip_min = int(params.activation.attrs.a_min)
-                clip_max = int(params.activation.attrs.a_max)
+        lut = _empty_lut()
+        activation, clip_min, clip_max = _extract_activation(
+            params, ethosu_patterns.QnnDepthwiseConv2DParams.activation_map
+        )
         scale_bias = vela_api.pack_biases(
-            biases=params.biases.tensor.data.asnumpy(),
+            biases=params.biases.tensor.data.numpy(),
             ifm_scale=params.ifm.q_params.scale_f32,
-            ifm_dtype=np.dtype(params.ifm.dtype),
+            ifm_dtype=_NP_DTYPES[params.ifm.dtype],
             weight_scales=params.weights.q_params.scale_f32,
             ofm_scale=params.ofm.q_params.scale_f32,
             is_activation_tanh_or_sigmoid=activation in ["TANH", "SIGMOID"],
@@ -400,8 +524,8 @@ class DepthwiseConv2DRewriter(DFPatternCallback):
             int(params.weights.q_params.zero_point),
             float(params.ofm.q_params.scale_f32),
             int(params.ofm.q_params.zero_point),
-            kernel_shape_map[str(params.weights.layout)],
-            params.ofm.shape[channels_map[str(params.ofm.layout)]],
+            params.weights.shape[self.kernel_shape_map[weights_layout]],
+            params.ofm.shape[self.channels_map[ofm_layout]],
             strides=params.strides,
             padding=params.padding,
             dilation=params.dilation,
@@ -409,8 +533,8 @@ class DepthwiseConv2DRewriter(DFPatternCallback):
             clip_min=clip_min,
             clip_max=clip_max,
             upscale="NONE",
-            ifm_layout=str(params.ifm.layout),
-            ofm_layout=str(params.ofm.layout),
+            ifm_layout=ifm_layout,
+            ofm_layout=ofm_layout,
             ofm_dtype=str(params.ofm.dtype),
         )
         return ethosu_depthwise_conv2d
@@ -423,10 +547,11 @@ class LegalizeDepthwiseConv2D:
     def transform_module(
         self, mod: tvm.ir.IRModule, ctx: tvm.ir.transform.PassContext
     ) -> tvm.ir.IRModule:
-        for global_var, func in mod.functions.items():
-            func = rewrite(DepthwiseConv2DRewriter(), func)
-            mod.update_func(global_var, func)
-        return mod
+        return _legalize_functions(
+            mod,
+            DepthwiseConv2DRewriter(),
+            {ethosu_patterns.QnnDepthwiseConv2DParams.composite_name},
+        )
 
     def __call__(self, *args, **kwargs):
         pass
@@ -436,38 +561,33 @@ class PoolingRewriter(DFPatternCallback):
     """Convert ethosu.avgpool2d and ethosu.maxpool2d composite functions to
     ethosu_pooling operators"""
 
+    channels_map = {"NHWC": 3}
+    activation_map = {"clip": "CLIP"}
+
     def __init__(
         self,
         params_class: Type,
         pattern: CallPattern,
     ):
-        super().__init__(require_type=True)
+        super().__init__(require_type=True, rewrite_once=True)
+        self.params_cache = dict()
         self.params_class = params_class
         self.pattern = pattern
 
     def callback(
         self, pre: tvm.relay.Expr, post: tvm.relay.Expr, node_map: tvm.ir.container.Map
     ) -> tvm.relay.Expr:
-        params = self.params_class(post.op.body)
+        params = _get_params(self.params_class, post.op, self.params_cache)
         params.ifm.tensor = post.args[0]
-        channels_map = {
-            "NHWC": 3,
-        }
-        if str(params.ofm.layout) not in channels_map.keys():
-            raise UnsupportedLayout(str(params.ofm.layout))
-
-        activation_map = {"clip": "CLIP"}
-        if params.activation:
-            activation = activation_map[params.activation.op.name]
-            clip_min = int(params.activation.attrs.a_min)
-            clip_max = int(params.activation.attrs.a_max)
-        else:
-            activation = "NONE"
-            clip_min = 0
-            clip_max = 0
+        ifm_layout = str(params.ifm.layout)
+        ofm_layout = str(params.ofm.layout)
+        if ofm_layout not in self.channels_map.keys():
+            raise UnsupportedLayout(ofm_layout)
+
+        activation, clip_min, clip_max = _extract_activation(params, self.activation_map)
 
         # Activations requiring LUT is currently not supported, so setting it to an empty list
-        lut = relay.const([], dtype="int8")
+        lut = _empty_lut()
 
         return ethosu_ops.ethosu_pooling(
             ifm=post.args[0],
@@ -478,15 +598,15 @@ class PoolingRewriter(DFPatternCallback):
             ofm_scale=params.ofm.q_params.scale_f32,
             ofm_zero_point=params.ofm.q_params.zero_point,
             pool_shape=params.pool_shape,
-            ofm_channels=params.ofm.shape[channels_map[str(params.ofm.layout)]],
+            ofm_channels=params.ofm.shape[self.channels_map[ofm_layout]],
             strides=params.strides,
             padding=params.padding,
             activation=activation,
             clip_min=clip_min,
             clip_max=clip_max,
             upscale="NONE",
-            ifm_layout=str(params.ifm.layout),
-            ofm_layout=str(params.ofm.layout),
+            ifm_layout=ifm_layout,
+            ofm_layout=ofm_layout,
         )
 
 
@@ -494,9 +614,7 @@ class MaxPoolingRewriter(PoolingRewriter):
     def __init__(self):
         super().__init__(
             params_class=ethosu_patterns.MaxPool2DParams,
-            pattern=(
-                wildcard().has_attr({"Composite": ethosu_patterns.MaxPool2DParams.composite_name})
-            )(wildcard()),
+            pattern=_get_composite_pattern(ethosu_patterns.MaxPool2DParams.composite_name),
         )
 
 
@@ -507,10 +625,9 @@ class LegalizeMaxPooling:
     def transform_module(
         self, mod: tvm.ir.IRModule, ctx: tvm.ir.transform.PassContext
     ) -> tvm.ir.IRModule:
-        for global_var, func in mod.functions.items():
-            func = rewrite(MaxPoolingRewriter(), func)
-            mod.update_func(global_var, func)
-        return mod
+        return _legalize_functions(
+            mod, MaxPoolingRewriter(), {ethosu_patterns.MaxPool2DParams.composite_name}
+        )
 
     def __call__(self, *args, **kwargs):
         pass
@@ -520,9 +637,7 @@ class AvgPoolingRewriter(PoolingRewriter):
     def __init__(self):
         super().__init__(
             params_class=ethosu_patterns.AvgPool2DParams,
-            pattern=(
-                wildcard().has_attr({"Composite": ethosu_patterns.AvgPool2DParams.composite_name})
-            )(wildcard()),
+            pattern=_get_composite_pattern(ethosu_patterns.AvgPool2DParams.composite_name),
         )
 
 
@@ -533,10 +648,9 @@ class LegalizeAvgPooling:
     def transform_module(
         self, mod: tvm.ir.IRModule, ctx: tvm.ir.transform.PassContext
     ) -> tvm.ir.IRModule:
-        for global_var, func in mod.functions.items():
-            func = rewrite(AvgPoolingRewriter(), func)
-            mod.update_func(global_var, func)
-        return mod
+        return _legalize_functions(
+            mod, AvgPoolingRewriter(), {ethosu_patterns.AvgPool2DParams.composite_name}
+        )
 
     def __call__(self, *args, **kwargs):
         pass
@@ -546,12 +660,16 @@ class BinaryElementwiseRewriter(DFPatternCallback):
     """Convert ethosu binary elementwise composite functions to
     ethosu_binary_elementwise operators"""
 
+    channels_map = {"NHWC": 3}
+    activation_map = {"clip": "CLIP"}
+
     def __init__(
         self,
         params_class: Type,
         pattern: CallPattern,
     ):
-        super().__init__(require_type=True)
+        super().__init__(require_type=True, rewrite_once=True)
+        self.params_cache = dict()
         self.params_class = params_class
         self.pattern = pattern
 
@@ -575,11 +693,9 @@ class BinaryElementwiseRewriter(DFPatternCallback):
         reshaped_inputs = []
         for i in inputs:
             in_shape = i.shape
-            if len(in_shape) < 4:
-                pad_size = 4 - len(in_shape)
-                new_shape = ([1] * pad_size) + in_shape
-                new_call = relay.reshape(i.tensor, new_shape)
-                reshaped_inputs.append(new_call)
+            pad_size = 4 - len(in_shape)
+            if pad_size > 0:
+                reshaped_inputs.append(relay.reshape(i.tensor, [1] * pad_size + in_shape))
             else:
                 reshaped_inputs.append(i.tensor)
         return reshaped_inputs
@@ -612,27 +728,19 @@ class BinaryElementwiseRewriter(DFPatternCallback):
     def callback(
         self, pre: tvm.relay.Expr, post: tvm.relay.Expr, node_map: tvm.ir.container.Map
     ) -> tvm.relay.Expr:
-        params = self.params_class(post.op.body)
+        params = _get_params(self.params_class, post.op, self.params_cache)
         params.ifm.tensor = post.args[1] if params.reversed_operands else post.args[0]
         params.ifm2.tensor = post.args[0] if params.reversed_operands else post.args[1]
-        channels_map = {
-            "NHWC": 3,
-        }
-        if str(params.ofm.layout) not in channels_map.keys():
-            raise UnsupportedLayout(str(params.ofm.layout))
-
-        activation_map = {"clip": "CLIP"}
-        if params.activation:
-            activation = activation_map[params.activation.op.name]
-            clip_min = int(params.activation.attrs.a_min)
-            clip_max = int(params.activation.attrs.a_max)
-        else:
-            activation = "NONE"
-            clip_min = 0
-            clip_max = 0
+        ifm_layout = str(params.ifm.layout)
+        ifm2_layout = str(params.ifm2.layout)
+        ofm_layout = str(params.ofm.layout)
+        if ofm_layout not in self.channels_map.keys():
+            raise UnsupportedLayout(ofm_layout)
+
+        activation, clip_min, clip_max = _extract_activation(params, self.activation_map)
 
         # We don't yet support activation functions that need to get legalized to LUTs.
-        lut = relay.const([], dtype="int8")
+        lut = _empty_lut()
 
         inputs = [params.ifm, params.ifm2]
         inputs = self.reshape_input(inputs)
@@ -655,9 +763,9 @@ class BinaryElementwiseRewriter(DFPatternCallback):
             activation=activation,
             clip_min=clip_min,
             clip_max=clip_max,
-            ifm_layout=str(params.ifm.layout),
-            ifm2_layout=str(params.ifm2.layout),
-            ofm_layout=str(params.ofm.layout),
+            ifm_layout=ifm_layout,
+            ifm2_layout=ifm2_layout,
+            ofm_layout=ofm_layout,
         )
         output = self.reshape_output(ethosu_binary_elementwise, params.ifm.shape)
         return output
@@ -667,9 +775,7 @@ class AddRewriter(BinaryElementwiseRewriter):
     def __init__(self):
         super().__init__(
             params_class=ethosu_patterns.AddParams,
-            pattern=(wildcard().has_attr({"Composite": ethosu_patterns.AddParams.composite_name}))(
-                wildcard(), wildcard()
-            ),
+            pattern=_get_composite_pattern(ethosu_patterns.AddParams.composite_name, num_inputs=2),
         )
 
 
@@ -680,10 +786,7 @@ class LegalizeAdd:
     def transform_module(
         self, mod: tvm.ir.IRModule, ctx: tvm.ir.transform.PassContext
     ) -> tvm.ir.IRModule:
-        for global_var, func in mod.functions.items():
-            func = rewrite(AddRewriter(), func)
-            mod.update_func(global_var, func)
-        return mod
+        return _legalize_functions(mod, AddRewriter(), {ethosu_patterns.AddParams.composite_name})
 
     def __call__(self, *args, **kwargs):
         pass
@@ -693,9 +796,7 @@ class SubRewriter(BinaryElementwiseRewriter):
     def __init__(self):
         super().__init__(
             params_class=ethosu_patterns.SubParams,
-            pattern=(wildcard().has_attr({"Composite": ethosu_patterns.SubParams.composite_name}))(
-                wildcard(), wildcard()
-            ),
+            pattern=_get_composite_pattern(ethosu_patterns.SubParams.composite_name, num_inputs=2),
         )
 
 
@@ -706,10 +807,7 @@ class LegalizeSub:
     def transform_module(
         self, mod: tvm.ir.IRModule, ctx: tvm.ir.transform.PassContext
     ) -> tvm.ir.IRModule:
-        for global_var, func in mod.functions.items():
-            func = rewrite(SubRewriter(), func)
-            mod.update_func(global_var, func)
-        return mod
+        return _legalize_functions(mod, SubRewriter(), {ethosu_patterns.SubParams.composite_name})
 
     def __call__(self, *args, **kwargs):
         pass
@@ -719,9 +817,7 @@ class MulRewriter(BinaryElementwiseRewriter):
     def __init__(self):
         super().__init__(
             params_class=ethosu_patterns.MulParams,
-            pattern=(wildcard().has_attr({"Composite": ethosu_patterns.MulParams.composite_name}))(
-                wildcard(), wildcard()
-            ),
+            pattern=_get_composite_pattern(ethosu_patterns.MulParams.composite_name, num_inputs=2),
         )
 
 
@@ -732,10 +828,7 @@ class LegalizeMul:
     def transform_module(
         self, mod: tvm.ir.IRModule, ctx: tvm.ir.transform.PassContext
     ) -> tvm.ir.IRModule:
-        for global_var, func in mod.functions.items():
-            func = rewrite(MulRewriter(), func)
-            mod.update_func(global_var, func)
-        return mod
+        return _legalize_functions(mod, MulRewriter(), {ethosu_patterns.MulParams.composite_name})
 
     def __call__(self, *args, **kwargs):
         pass
@@ -745,9 +838,7 @@ class MinRewriter(BinaryElementwiseRewriter):
     def __init__(self):
         super().__init__(
             params_class=ethosu_patterns.MinParams,
-            pattern=(wildcard().has_attr({"Composite": ethosu_patterns.MinParams.composite_name}))(
-                wildcard(), wildcard()
-            ),
+            pattern=_get_composite_pattern(ethosu_patterns.MinParams.composite_name, num_inputs=2),
         )
 
 
@@ -758,10 +849,7 @@ class LegalizeMin:
     def transform_module(
         self, mod: tvm.ir.IRModule, ctx: tvm.ir.transform.PassContext
     ) -> tvm.ir.IRModule:
-        for global_var, func in mod.functions.items():
-            func = rewrite(MinRewriter(), func)
-            mod.update_func(global_var, func)
-        return mod
+        return _legalize_functions(mod, MinRewriter(), {ethosu_patterns.MinParams.composite_name})
 
     def __call__(self, *args, **kwargs):
         pass
@@ -771,9 +859,7 @@ class MaxRewriter(BinaryElementwiseRewriter):
     def __init__(self):
         super().__init__(
             params_class=ethosu_patterns.MaxParams,
-            pattern=(wildcard().has_attr({"Composite": ethosu_patterns.MaxParams.composite_name}))(
-                wildcard(), wildcard()
-            ),
+            pattern=_get_composite_pattern(ethosu_patterns.MaxParams.composite_name, num_inputs=2),
         )
 
 
@@ -784,10 +870,7 @@ class LegalizeMax:
     def transform_module(
         self, mod: tvm.ir.IRModule, ctx: tvm.ir.transform.PassContext
     ) -> tvm.ir.IRModule:
-        for global_var, func in mod.functions.items():
-            func = rewrite(MaxRewriter(), func)
-            mod.update_func(global_var, func)
-        return mod
+        return _legalize_functions(mod, MaxRewriter(), {ethosu_patterns.MaxParams.composite_name})
 
     def __call__(self, *args, **kwargs):
         pass
@@ -797,9 +880,7 @@ class ShlRewriter(BinaryElementwiseRewriter):
     def __init__(self):
         super().__init__(
             params_class=ethosu_patterns.ShlParams,
-            pattern=(wildcard().has_attr({"Composite": ethosu_patterns.ShlParams.composite_name}))(
-                wildcard(), wildcard()
-            ),
+            pattern=_get_composite_pattern(ethosu_patterns.ShlParams.composite_name, num_inputs=2),
         )
 
 
@@ -810,10 +891,29 @@ class LegalizeShl:
     def transform_module(
         self, mod: tvm.ir.IRModule, ctx: tvm.ir.transform.PassContext
     ) -> tvm.ir.IRModule:
-        for global_var, func in mod.functions.items():
-            func = rewrite(ShlRewriter(), func)
-            mod.update_func(global_var, func)
-        return mod
+        return _legalize_functions(mod, ShlRewriter(), {ethosu_patterns.ShlParams.composite_name})
+
+    def __call__(self, *args, **kwargs):
+        pass
+
+
+@ir.transform.module_pass(opt_level=1)
+class LegalizeBinaryElementwise:
+    """This is the pass that wraps all the binary elementwise rewriters, so that they
+    are applied in a single rewrite of each function"""
+
+    def transform_module(
+        self, mod: tvm.ir.IRModule, ctx: tvm.ir.transform.PassContext
+    ) -> tvm.ir.IRModule:
+        composite_names = [
+            ethosu_patterns.AddParams.composite_name,
+            ethosu_patterns.SubParams.composite_name,
+            ethosu_patterns.MulParams.composite_name,
+            ethosu_patterns.MinParams.composite_name,
+            ethosu_patterns.MaxParams.composite_name,
+            ethosu_patterns.ShlParams.composite_name,
+        ]
+        return _legalize_functions(mod, CompositeRewriter(composite_names), set(composite_names))
 
     def __call__(self, *args, **kwargs):
         pass
@@ -824,16 +924,15 @@ class StridedSliceRewriter(DFPatternCallback):
 
     def __init__(self):
         super().__init__(require_type=True, rewrite_once=True)
-        self.pattern = (
-            wildcard().has_attr({"Composite": ethosu_patterns.StridedSliceParams.composite_name})
-        )(wildcard())
+        self.pattern = _get_composite_pattern(ethosu_patterns.StridedSliceParams.composite_name)
+        self.params_cache = dict()
 
     def callback(
         self, pre: tvm.relay.Expr, post: tvm.relay.Expr, node_map: tvm.ir.container.Map
     ) -> tvm.relay.Expr:
 
         slice_input = post.args[0]
-        params = ethosu_patterns.StridedSliceParams(post.op.body)
+        params = _get_params(ethosu_patterns.StridedSliceParams, post.op, self.params_cache)
         strided_slice = relay.op.strided_slice(
             slice_input,
             params.begin,
@@ -852,10 +951,9 @@ class LegalizeStridedSlice:
     def transform_module(
         self, mod: tvm.ir.IRModule, ctx: tvm.ir.transform.PassContext
     ) -> tvm.ir.IRModule:
-        for global_var, func in mod.functions.items():
-            func = rewrite(StridedSliceRewriter(), func)
-            mod.update_func(global_var, func)
-        return mod
+        return _legalize_functions(
+            mod, StridedSliceRewriter(), {ethosu_patterns.StridedSliceParams.composite_name}
+        )
 
     def __call__(self, *args, **kwargs):
         pass
@@ -866,15 +964,20 @@ class ReshapeRewriter(DFPatternCallback):
 
     def __init__(self):
         super().__init__(require_type=True, rewrite_once=True)
-        self.pattern = (
-            wildcard().has_attr({"Composite": ethosu_patterns.ReshapeParams.composite_name})
-        )(wildcard())
+        self.pattern = _get_composite_pattern(ethosu_patterns.ReshapeParams.composite_name)
+        self.params_cache = dict()
 
     def callback(
         self, pre: tvm.relay.Expr, post: tvm.relay.Expr, node_map: tvm.ir.container.Map
     ) -> tvm.relay.Expr:
         reshape_input = post.args[0]
-        reshape_params = ethosu_patterns.ReshapeParams(post.op.body)
+        reshape_params = _get_params(ethosu_patterns.ReshapeParams, post.op, self.params_cache)
+        # A reshape that doesn't change the shape is dropped, unless its input is an input of
+        # the function, which would then be left without any NPU operation
+        if reshape_params.ifm.shape == reshape_params.ofm.shape and isinstance(
+            reshape_input, tvm.relay.expr.Call
+        ):
+            return reshape_input
         new_shape = reshape_params.new_shape
         return relay.op.reshape(reshape_input, newshape=new_shape)
 
@@ -886,10 +989,9 @@ class LegalizeReshape:
     def transform_module(
         self, mod: tvm.ir.IRModule, ctx: tvm.ir.transform.PassContext
     ) -> tvm.ir.IRModule:
-        for global_var, func in mod.functions.items():
-            func = rewrite(ReshapeRewriter(), func)
-            mod.update_func(global_var, func)
-        return mod
+        return _legalize_functions(
+            mod, ReshapeRewriter(), {ethosu_patterns.ReshapeParams.composite_name}
+        )
 
     def __call__(self, *args, **kwargs):
         pass
@@ -903,6 +1005,8 @@ class NoOpRewriter(DFPatternCallback):
         super().__init__(require_type=True, rewrite_once=True)
         self.reshape = is_op("reshape")(wildcard())
         self.strided_slice = is_op("strided_slice")(wildcard())
+        # A single alternation is matched in one traversal, whereas every callback given
+        # to rewrite() runs its own type inference and traversal of the function
         self.pattern = self.reshape | self.strided_slice
 
     def callback(
@@ -910,7 +1014,10 @@ class NoOpRewriter(DFPatternCallback):
     ) -> tvm.relay.Expr:
         if pre.checked_type.dtype == "int32":
             return post
-        return ethosu_ops.ethosu_identity(ifm=post, lut=relay.const([], dtype="int8"))
+        # The reshape or strided slice is kept as the input of the identity rather than
+        # folded into it: both only become views of their input when lowered to TIR, and
+        # the identity is the NPU operation that reads through that view
+        return ethosu_ops.ethosu_identity(ifm=post, lut=_empty_lut())
 
 
 @ir.transform.module_pass(opt_level=1)
@@ -920,10 +1027,7 @@ class LegalizeNoOps:
     def transform_module(
         self, mod: tvm.ir.IRModule, ctx: tvm.ir.transform.PassContext
     ) -> tvm.ir.IRModule:
-        for global_var, func in mod.functions.items():
-            func = rewrite(NoOpRewriter(), func)
-            mod.update_func(global_var, func)
-        return mod
+        return _legalize_functions(mod, NoOpRewriter())
 
     def __call__(self, *args, **kwargs):
         pass
@@ -935,41 +1039,39 @@ class UnaryElementwiseRewriter(DFPatternCallback):
     ethosu_unary_elementwise operators
     """
 
+    activation_map = {"clip": "CLIP"}
+
     def __init__(self, params_class: Type, pattern: CallPattern):
-        super().__init__(require_type=True)
+        super().__init__(require_type=True, rewrite_once=True)
         self.params_class = params_class
         self.pattern = pattern
+        self.params_cache = dict()
 
     def callback(
         self, pre: tvm.relay.Expr, post: tvm.relay.Expr, node_map: tvm.ir.container.Map
     ) -> tvm.relay.Expr:
-        params = self.params_class(post.op.body)
+        params = _get_params(self.params_class, post.op, self.params_cache)
         params.ifm.tensor = post.args[0]
 
-        if str(params.ofm.layout) != "NHWC":
-            raise UnsupportedLayout(str(params.ofm.layout))
+        ifm_layout = str(params.ifm.layout)
+        ofm_layout = str(params.ofm.layout)
+        if ofm_layout != "NHWC":
+            raise UnsupportedLayout(ofm_layout)
 
-        activation_map = {"clip": "CLIP"}
-        if params.activation:
-            activation = activation_map[params.activation.op.name]
-            clip_min = int(params.activation.attrs.a_min)
-            clip_max = int(params.activation.attrs.a_max)
-        else:
-            activation = "NONE"
-            clip_min = 0
-            clip_max = 0
+        activation, clip_min, clip_max = _extract_activation(params, self.activation_map)
 
         # We don't yet support activation functions that use LUT.
-        lut = relay.const([], dtype="int8")
+        lut = _empty_lut()
 
-        unary_input_shape = params.ifm.shape
+        ifm_shape = params.ifm.shape
+        pad_size = 4 - len(ifm_shape)
         # If the input tensor is not 4D, enter reshapes before and after the unary operator
-        if len(params.ifm.shape) == 4:
-            unary_input = params.ifm.tensor
-        else:
-            pad_size = 4 - len(unary_input_shape)
-            unary_input_shape = ([1] * pad_size) + unary_input_shape
+        if pad_size:
+            unary_input_shape = ([1] * pad_size) + ifm_shape
             unary_input = relay.op.reshape(params.ifm.tensor, newshape=unary_input_shape)
+        else:
+            unary_input_shape = ifm_shape
+            unary_input = params.ifm.tensor
 
         ethosu_unary_elementwise = ethosu_ops.ethosu_unary_elementwise(
             ifm=unary_input,
@@ -983,23 +1085,19 @@ class UnaryElementwiseRewriter(DFPatternCallback):
             activation=activation,
             clip_min=clip_min,
             clip_max=clip_max,
-            ifm_layout=str(params.ifm.layout),
-            ofm_layout=str(params.ofm.layout),
+            ifm_layout=ifm_layout,
+            ofm_layout=ofm_layout,
         )
-        if len(params.ifm.shape) == 4:
-            op = ethosu_unary_elementwise
-        else:
-            op = relay.op.reshape(ethosu_unary_elementwise, newshape=params.ifm.shape)
-        return op
+        if pad_size:
+            return relay.op.reshape(ethosu_unary_elementwise, newshape=ifm_shape)
+        return ethosu_unary_elementwise
 
 
 class AbsRewriter(UnaryElementwiseRewriter):
     def __init__(self):
         super().__init__(
             params_class=ethosu_patterns.AbsParams,
-            pattern=(wildcard().has_attr({"Composite": ethosu_patterns.AbsParams.composite_name}))(
-                wildcard()
-            ),
+            pattern=_get_composite_pattern(ethosu_patterns.AbsParams.composite_name),
         )
 
 
@@ -1010,15 +1108,42 @@ class LegalizeAbs:
     def transform_module(
         self, mod: tvm.ir.IRModule, ctx: tvm.ir.transform.PassContext
     ) -> tvm.ir.IRModule:
-        for global_var, func in mod.functions.items():
-            func = rewrite(AbsRewriter(), func)
-            mod.update_func(global_var, func)
-        return mod
+        return _legalize_functions(mod, AbsRewriter(), {ethosu_patterns.AbsParams.composite_name})
 
     def __call__(self, *args, **kwargs):
         pass
 
 
+def _get_mean_weights_and_biases(
+    weights_cache: Dict[Tuple, Tuple[tvm.nd.NDArray, tvm.nd.NDArray]],
+    weight_shape: Tuple[int, int, int, int],
+    ifm_dtype: str,
+    ifm_scale: float,
+    ofm_scale: float,
+    weight_scale: float,
+    bias: int,
+) -> Tuple[tvm.nd.NDArray, tvm.nd.NDArray]:
+    """Create the data of the all-ones depthwise weights and of the packed scale and bias
+    used to legalize a mean, reusing the data when the rewriter already created it for a mean
+    with the same shape and quantization. The scales are taken as Python floats so that they
+    can be part of the key, and are quantized as the float32 values they were parsed from."""
+    key = (weight_shape, ifm_dtype, ifm_scale, ofm_scale, weight_scale, bias)
+    weights_and_biases = weights_cache.get(key)
+    if weights_and_biases is None:
+        weight_values = np.ones(weight_shape, dtype=ifm_dtype)
+        scale_bias = vela_api.pack_biases(
+            biases=np.full(weight_shape[0], bias, dtype=np.int64),
+            ifm_scale=np.float32(ifm_scale),
+            ifm_dtype=_NP_DTYPES[ifm_dtype],
+            weight_scales=np.array([weight_scale], dtype=np.float64),
+            ofm_scale=np.float32(ofm_scale),
+            is_activation_tanh_or_sigmoid=False,
+        )
+        weights_and_biases = tvm.nd.array(weight_values), tvm.nd.array(scale_bias)
+        weights_cache[key] = weights_and_biases
+    return weights_and_biases
+
+
 class MeanRewriter(DFPatternCallback):
     """Convert ethosu.mean composite functions to to an equivalent legalization:
     - Case 1 (axis == [1, 2] and keepsdims == True):
@@ -1028,20 +1153,26 @@ class MeanRewriter(DFPatternCallback):
     """
 
     def __init__(self):
-        super().__init__(require_type=True)
-        self.pattern = (
-            wildcard().has_attr({"Composite": ethosu_patterns.MeanParams.composite_name})
-        )(wildcard())
+        super().__init__(require_type=True, rewrite_once=True)
+        self.pattern = _get_composite_pattern(ethosu_patterns.MeanParams.composite_name)
+        self.params_cache = dict()
+        self.weights_cache = dict()
 
     def callback(
         self, pre: tvm.relay.Expr, post: tvm.relay.Expr, node_map: tvm.ir.container.Map
     ) -> tvm.relay.Expr:
-        params = ethosu_patterns.MeanParams(post.op.body)
+        params = _get_params(ethosu_patterns.MeanParams, post.op, self.params_cache)
         params.ifm.tensor = post.args[0]
 
         ifm_shape = params.ifm.shape
         ofm_shape = params.ofm.shape
-        lut = relay.const([], "int8")
+        ifm_q_params = params.ifm.q_params
+        ofm_q_params = params.ofm.q_params
+        ifm_scale = float(ifm_q_params.scale_f32)
+        ifm_zero_point = int(ifm_q_params.zero_point)
+        ofm_scale = float(ofm_q_params.scale_f32)
+        ofm_zero_point = int(ofm_q_params.zero_point)
+        lut = _empty_lut()
         axis = params.axis
         reduced_op = params.ifm.tensor
 
@@ -1054,6 +1185,7 @@ class MeanRewriter(DFPatternCallback):
                 ifm_shape = [1, params.height, params.width, 1]
             reduced_op = relay.reshape(reduced_op, ifm_shape)
 
+        reduce_height_and_width = axis == [1, 2]
         filter_height = ifm_shape[1] if 1 in axis else 1
         filter_width = ifm_shape[2] if 2 in axis else 1
         in_channels = out_channels = ifm_shape[-1]
@@ -1061,34 +1193,34 @@ class MeanRewriter(DFPatternCallback):
         # If the height is greater than max kernel height, reshape the input
         # from [filter_height, filter_width] to [1, (filter_height*filter_width)]
         # only in the case the axis is [1, 2].
-        if axis == [1, 2] and filter_height > 64:
+        if reduce_height_and_width and filter_height > 64:
             ifm_shape = (ifm_shape[0], 1, filter_height * filter_width, in_channels)
             filter_width = filter_height * filter_width
             filter_height = 1
             reduced_op = relay.reshape(reduced_op, ifm_shape)
 
-        if axis == [1, 2] and params.keepdims:
+        if reduce_height_and_width and params.keepdims:
             weight_scale = 1
-            weight_values = np.ones([out_channels, filter_height, filter_width, in_channels])
-            scale_bias = vela_api.pack_biases(
-                biases=np.zeros(ifm_shape[-1]),
-                ifm_scale=params.ifm.q_params.scale_f32,
-                ifm_dtype=np.dtype(params.ifm.dtype),
-                weight_scales=np.array([weight_scale], dtype=np.float),
-                ofm_scale=params.ofm.q_params.scale_f32,
-                is_activation_tanh_or_sigmoid=False,
+            weights, scale_bias = _get_mean_weights_and_biases(
+                self.weights_cache,
+                weight_shape=(out_channels, filter_height, filter_width, in_channels),
+                ifm_dtype=params.ifm.dtype,
+                ifm_scale=ifm_scale,
+                ofm_scale=ofm_scale,
+                weight_scale=weight_scale,
+                bias=0,
             )
 
             reduced_op = ethosu_ops.ethosu_depthwise_conv2d(
                 ifm=reduced_op,
-                weight=relay.const(weight_values, params.ifm.dtype),
-                scale_bias=relay.const(scale_bias, "uint8"),
+                weight=relay.Constant(weights),
+                scale_bias=relay.Constant(scale_bias),
                 lut=lut,
-                ifm_scale=float(params.ifm.q_params.scale_f32),
-                ifm_zero_point=int(params.ifm.q_params.zero_point),
+                ifm_scale=ifm_scale,
+                ifm_zero_point=ifm_zero_point,
                 weight_zero_point=0,
-                ofm_scale=float(params.ofm.q_params.scale_f32),
-                ofm_zero_point=int(params.ofm.q_params.zero_point),
+                ofm_scale=ofm_scale,
+                ofm_zero_point=ofm_zero_point,
                 kernel_shape=(filter_height, filter_width),
                 ofm_channels=out_channels,
                 ofm_dtype="int16",
@@ -1097,36 +1229,33 @@ class MeanRewriter(DFPatternCallback):
             n = int(filter_height * filter_width)
             eps = 1 / (256 * (n + 1)) if n % 2 == 0 else 0
 
-            scalar_tensor = relay.const(np.ones([1, 1, 1, 1], dtype="int16"), dtype="int16")
+            scalar_tensor = relay.Constant(_INT16_ONE)
 
             reduced_op = ethosu_ops.ethosu_binary_elementwise(
                 ifm=reduced_op,
                 ifm2=scalar_tensor,
                 lut=lut,
                 operator_type="MUL",
-                ifm_scale=float(params.ofm.q_params.scale_f32),
-                ifm_zero_point=int(params.ofm.q_params.zero_point),
+                ifm_scale=ofm_scale,
+                ifm_zero_point=ofm_zero_point,
                 ifm2_scale=1 / (n - eps),
                 ifm2_zero_point=0,
-                ofm_scale=float(params.ofm.q_params.scale_f32),
-                ofm_zero_point=int(params.ofm.q_params.zero_point),
+                ofm_scale=ofm_scale,
+                ofm_zero_point=ofm_zero_point,
                 ifm_channels=out_channels,
                 ifm2_channels=out_channels,
                 reversed_operands=False,
                 ofm_dtype="int8",
                 rounding_mode="NATURAL",
             )
-        elif (
-            params.ifm.q_params.scale_f32 == params.ofm.q_params.scale_f32
-            and params.ifm.q_params.zero_point == params.ofm.q_params.zero_point
-        ):
+        elif ifm_scale == ofm_scale and ifm_zero_point == ofm_zero_point:
             reduced_op = ethosu_ops.ethosu_pooling(
                 ifm=reduced_op,
                 lut=lut,
                 pooling_type="AVG",
-                ifm_scale=float(params.ifm.q_params.scale_f32),
+                ifm_scale=ifm_scale,
                 ifm_zero_point=0,
-                ofm_scale=float(params.ofm.q_params.scale_f32),
+                ofm_scale=ofm_scale,
                 ofm_zero_point=0,
                 pool_shape=(filter_height, filter_width),
                 ofm_channels=out_channels,
@@ -1134,27 +1263,27 @@ class MeanRewriter(DFPatternCallback):
             )
         else:
             weight_scale = 1 / (filter_height * filter_width)
-            weight_values = np.ones([out_channels, filter_height, filter_width, in_channels])
-            bias = -1 * int(params.ifm.q_params.zero_point) * filter_height * filter_width
-
-            scale_bias = vela_api.pack_biases(
-                biases=np.ones([ifm_shape[-1]]) * bias,
-                ifm_scale=params.ifm.q_params.scale_f32,
-                ifm_dtype=np.dtype(params.ifm.dtype),
-                weight_scales=np.array([weight_scale], dtype=np.float),
-                ofm_scale=params.ofm.q_params.scale_f32,
-                is_activation_tanh_or_sigmoid=False,
+            bias = -1 * ifm_zero_point * filter_height * filter_width
+
+            weights, scale_bias = _get_mean_weights_and_biases(
+                self.weights_cache,
+                weight_shape=(out_channels, filter_height, filter_width, in_channels),
+                ifm_dtype=params.ifm.dtype,
+                ifm_scale=ifm_scale,
+                ofm_scale=ofm_scale,
+                weight_scale=weight_scale,
+                bias=bias,
             )
             reduced_op = ethosu_ops.ethosu_depthwise_conv2d(
                 ifm=reduced_op,
-                weight=relay.const(weight_values, params.ifm.dtype),
-                scale_bias=relay.const(scale_bias, "uint8"),
+                weight=relay.Constant(weights),
+                scale_bias=relay.Constant(scale_bias),
                 lut=lut,
-                ifm_scale=float(params.ifm.q_params.scale_f32),
+                ifm_scale=ifm_scale,
                 ifm_zero_point=0,
                 weight_zero_point=0,
-                ofm_scale=float(params.ofm.q_params.scale_f32),
-                ofm_zero_point=int(params.ofm.q_params.zero_point),
+                ofm_scale=ofm_scale,
+                ofm_zero_point=ofm_zero_point,
                 kernel_shape=(filter_height, filter_width),
                 ofm_channels=out_channels,
                 rounding_mode="NATURAL",
@@ -1174,10 +1303,7 @@ class LegalizeMean:
     def transform_module(
         self, mod: tvm.ir.IRModule, ctx: tvm.ir.transform.PassContext
     ) -> tvm.ir.IRModule:
-        for global_var, func in mod.functions.items():
-            func = rewrite(MeanRewriter(), func)
-            mod.update_func(global_var, func)
-        return mod
+        return _legalize_functions(mod, MeanRewriter(), {ethosu_patterns.MeanParams.composite_name})
 
     def __call__(self, *args, **kwargs):
         pass
@@ -1191,18 +1317,15 @@ class ConcatRewriter(DFPatternCallback):
 
     def __init__(self):
         super().__init__(require_type=True, rewrite_once=True)
-        self.pattern = (
-            wildcard().has_attr({"Composite": ethosu_patterns.ConcatParams.composite_name})
-        )(None)
+        self.pattern = _get_composite_pattern(
+            ethosu_patterns.ConcatParams.composite_name, num_inputs=None
+        )
 
     def callback(
         self, pre: tvm.relay.Expr, post: tvm.relay.Expr, node_map: tvm.ir.container.Map
     ) -> tvm.relay.Expr:
         # Find the tensors that are inputs to the concat and the scales and zero points
-        concat_args = list()
-        for arg in post.args:
-            if isinstance(arg, tvm.relay.expr.Call):
-                concat_args.append(arg)
+        concat_args = [arg for arg in post.args if isinstance(arg, tvm.relay.expr.Call)]
 
         axis = post.op.body.attrs.axis
         concat = relay.op.concatenate(relay.Tuple(concat_args), axis=axis)
@@ -1216,15 +1339,72 @@ class LegalizeConcat:
     def transform_module(
         self, mod: tvm.ir.IRModule, ctx: tvm.ir.transform.PassContext
     ) -> tvm.ir.IRModule:
-        for global_var, func in mod.functions.items():
-            func = rewrite(ConcatRewriter(), func)
-            mod.update_func(global_var, func)
-        return mod
+        return _legalize_functions(
+            mod, ConcatRewriter(), {ethosu_patterns.ConcatParams.composite_name}
+        )
 
     def __call__(self, *args, **kwargs):
         pass
 
 
+# The rewriters legalizing each of the composite functions offloaded to the NPU, keyed on
+# the names of the composite functions
+_COMPOSITE_REWRITERS = {
+    params_class.composite_name: rewriter_class
+    for params_class, rewriter_class in (
+        (ethosu_patterns.QnnConv2DParams, Conv2DRewriter),
+        (ethosu_patterns.QnnDepthwiseConv2DParams, DepthwiseConv2DRewriter),
+        (ethosu_patterns.MaxPool2DParams, MaxPoolingRewriter),
+        (ethosu_patterns.AvgPool2DParams, AvgPoolingRewriter),
+        (ethosu_patterns.AddParams, AddRewriter),
+        (ethosu_patterns.SubParams, SubRewriter),
+        (ethosu_patterns.MulParams, MulRewriter),
+        (ethosu_patterns.MinParams, MinRewriter),
+        (ethosu_patterns.MaxParams, MaxRewriter),
+        (ethosu_patterns.ShlParams, ShlRewriter),
+        (ethosu_patterns.AbsParams, AbsRewriter),
+        (ethosu_patterns.TanhParams, TanhRewriter),
+        (ethosu_patterns.MeanParams, MeanRewriter),
+        (ethosu_patterns.ConcatParams, ConcatRewriter),
+        (ethosu_patterns.SigmoidParams, SigmoidRewriter),
+        (ethosu_patterns.ReshapeParams, ReshapeRewriter),
+        (ethosu_patterns.StridedSliceParams, StridedSliceRewriter),
+    )
+}
+
+# The composite functions and operators that LegalizeEthosU rewrites
+_LEGALIZED_NAMES = set(_COMPOSITE_REWRITERS) | {"split", "reshape", "strided_slice"}
+
+
+class CompositeRewriter(DFPatternCallback):
+    """Legalize all the composite functions offloaded to the NPU at once, by matching any
+    of them and dispatching to the rewriter of the matched composite function. This way
+    the function is type inferred and traversed only once for all the composites.
+    When composite_names is given, only these composite functions are legalized."""
+
+    def __init__(self, composite_names: Optional[List[str]] = None):
+        super().__init__(require_type=True, rewrite_once=True)
+        if composite_names is None:
+            composite_names = list(_COMPOSITE_REWRITERS)
+        self.rewriters = {
+            composite_name: _COMPOSITE_REWRITERS[composite_name]()
+            for composite_name in composite_names
+        }
+        self.pattern = functools.reduce(
+            operator.or_,
+            [
+                _get_composite_pattern(composite_name, num_inputs=None)
+                for composite_name in self.rewriters
+            ],
+        )
+
+    def callback(
+        self, pre: tvm.relay.Expr, post: tvm.relay.Expr, node_map: tvm.ir.container.Map
+    ) -> tvm.relay.Expr:
+        rewriter = self.rewriters[str(post.op.attrs["Composite"])]
+        return rewriter.callback(pre, post, node_map)
+
+
 @ir.transform.module_pass(opt_level=1)
 class LegalizeEthosU:
     """This is the pass to call graph-rewrites to perform graph transformation
@@ -1238,25 +1418,26 @@ class LegalizeEthosU:
         """This is the method that replaces the operations with hardware/codegen supported
         operations.
         """
-        mod = LegalizeSplit()(mod)
-        mod = LegalizeConv2D()(mod)
-        mod = LegalizeDepthwiseConv2D()(mod)
-        mod = LegalizeMaxPooling()(mod)
-        mod = LegalizeAvgPooling()(mod)
-        mod = LegalizeAdd()(mod)
-        mod = LegalizeSub()(mod)
-        mod = LegalizeMul()(mod)
-        mod = LegalizeMin()(mod)
-        mod = LegalizeMax()(mod)
-        mod = LegalizeShl()(mod)
-        mod = LegalizeAbs()(mod)
-        mod = LegalizeTanh()(mod)
-        mod = LegalizeMean()(mod)
-        mod = LegalizeConcat()(mod)
-        mod = LegalizeSigmoid()(mod)
-        mod = LegalizeReshape()(mod)
-        mod = LegalizeStridedSlice()(mod)
-        mod = LegalizeNoOps()(mod)
+        split_rewriter = SplitRewriter()
+        composite_rewriter = CompositeRewriter()
+        no_op_rewriter = NoOpRewriter()
+        for global_var, func in mod.functions.items():
+            called_names = _get_called_names(func)
+            if called_names.isdisjoint(_LEGALIZED_NAMES):
+                continue
+            rewriters = []
+            if "split" in called_names:
+                rewriters.append(split_rewriter)
+            if not called_names.isdisjoint(_COMPOSITE_REWRITERS):
+                rewriters.append(composite_rewriter)
+            new_func = func
+            if rewriters:
+                new_func = rewrite(rewriters, new_func)
+            # NoOpRewriter has to see the reshapes and strided slices brought out
+            # of their composite functions, so it runs as a separate rewrite
+            new_func = rewrite(no_op_rewriter, new_func)
+            if not new_func.same_as(func):
+                mod.update_func(global_var, new_func)
         return mod
 
     def __call__(self, *args, **kwargs):
@@ -197,6 +197,11 @@ def round_away_zero(f: Union[float, np.double, np.single, np.float32, np.float64
     return np.trunc(f + offset)
 
 
+def round_away_zero_array(values: np.ndarray) -> np.ndarray:
+    """Round the values element-wise away from zero towards +inf / -inf"""
+    return np.trunc(values + np.copysign(0.5, values))
+
+
 def round_up(a: int, b: int) -> int:
     """Round up to a multiple of b"""
     return ((a + b - 1) // b) * b
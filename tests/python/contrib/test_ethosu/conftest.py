@@ -0,0 +1,35 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+import os
+
+import pytest
+
+
+def pytest_collection_modifyitems(config, items):
+    # The accel_type parametrizations of a test case share its converted graphs, partitioned
+    # modules and reference data through the caches of the test modules, so with pytest-xdist's
+    # --dist=loadgroup they are grouped to run on the same worker
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    for item in items:
+        if not str(item.fspath).startswith(test_dir):
+            continue
+        callspec = getattr(item, "callspec", None)
+        if callspec is None or "accel_type" not in callspec.params:
+            continue
+        case_params = sorted((k, v) for k, v in callspec.params.items() if k != "accel_type")
+        group = "{}::{}{}".format(item.module.__name__, item.originalname, case_params)
+        item.add_marker(pytest.mark.xdist_group(group))
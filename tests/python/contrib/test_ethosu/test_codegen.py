@@ -15,6 +15,11 @@
 # specific language governing permissions and limitations
 # under the License.
 # pylint: disable=invalid-name, unused-argument
+from collections import OrderedDict
+from functools import lru_cache
+import os
+import zlib
+
 import pytest
 
 pytest.importorskip("ethosu.vela")
@@ -26,8 +31,8 @@ import tensorflow as tf
 from tvm import relay
 from tvm.relay.expr_functor import ExprMutator
 from tvm.relay.op.annotation import compiler_begin, compiler_end
-from tvm.relay.backend.contrib.ethosu import util
 from tvm.relay.backend.contrib.ethosu import preprocess
+from tvm.relay.build_module import bind_params_by_name
 from tvm.relay.op.contrib.ethosu import partition_for_ethosu
 from tests.python.relay.aot.aot_test_utils import generate_ref_data
 
@@ -36,19 +41,87 @@ from . import infra
 
 ACCEL_TYPES = ["ethos-u55-256", "ethos-u55-128", "ethos-u55-64", "ethos-u55-32"]
 
+# The tests check codegen rather than accuracy, a few samples are enough for the converter to
+# calibrate the min/max of uniformly distributed inputs
+NUM_CALIBRATION_SAMPLES = 10
+
+_DTYPE_RANGES = {
+    dtype: (int(np.iinfo(dtype).min), int(np.iinfo(dtype).max))
+    for dtype in ["int8", "uint8", "int32"]
+}
+
+_TF_POOLING_OPS = {"MAX": tf.nn.max_pool, "AVG": tf.nn.avg_pool}
+_TF_BINARY_OPS = {
+    "ADD": tf.math.add,
+    "SUB": tf.math.subtract,
+    "MUL": tf.math.multiply,
+    "MIN": tf.math.minimum,
+    "MAX": tf.math.maximum,
+}
+_TF_UNARY_OPS = {"ABS": tf.math.abs}
+
+# Set TVM_ETHOSU_PRINT_CMM to print the command streams of the tests that always compile them
+PRINT_CMM = bool(os.environ.get("TVM_ETHOSU_PRINT_CMM"))
+
+
+class _CaseCache:
+    """Cache the data a test case shares between its accel_type parametrizations. These run
+    one after the other, so only the most recently used entries are kept."""
+
+    def __init__(self, maxsize=8):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+
+    def get_or_create(self, key, create):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        else:
+            self.entries[key] = create()
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return self.entries[key]
+
+
+@pytest.fixture(autouse=True)
+def seed_random_inputs(request):
+    """Seed the inputs of a test deterministically, every accel_type parametrization of a
+    test gets the same seed so that the reference data can be shared between them"""
+    callspec = getattr(request.node, "callspec", None)
+    params = callspec.params if callspec else dict()
+    seed_key = repr(
+        (request.node.originalname, sorted((k, v) for k, v in params.items() if k != "accel_type"))
+    )
+    np.random.seed(zlib.crc32(seed_key.encode()))
+
+
+_REF_DATA_CACHE = _CaseCache()
+
 
-def infer_type_function_pass(func):
-    mod = tvm.IRModule()
-    mod["test"] = func
-    mod = relay.transform.InferType()(mod)
-    return mod["test"]
+def _generate_ref_data(mod, input_data):
+    """Run generate_ref_data once per structurally unique module and input data"""
+    key = (
+        tvm.ir.structural_hash(mod),
+        tuple(
+            (name, data.dtype.str, data.shape, data.tobytes())
+            for name, data in sorted(input_data.items())
+        ),
+    )
+    return _REF_DATA_CACHE.get_or_create(key, lambda: generate_ref_data(mod, input_data))
 
 
-def get_shape_expr(in_expr, out_expr):
-    main_f = relay.Function([in_expr], out_expr)
-    main_f = infer_type_function_pass(main_f)
-    shape = [int(i) for i in main_f.body.checked_type.shape]
-    return shape
+def conv2d_output_shape(qnn_conv2d_params):
+    """Compute the NHWC output shape of a conv2d made by relay_ir_builder.create_qnn_conv2d,
+    which resolves the padding of the params to [top, left, bottom, right]"""
+    pad_top, pad_left, pad_bottom, pad_right = qnn_conv2d_params.pad
+    stride_h, stride_w = qnn_conv2d_params.strides
+    dilation_h, dilation_w = qnn_conv2d_params.dilation
+    ifm = qnn_conv2d_params.ifm
+    kernel = qnn_conv2d_params.kernel
+    dilated_kernel_h = dilation_h * (kernel.get_dim_size("H") - 1) + 1
+    dilated_kernel_w = dilation_w * (kernel.get_dim_size("W") - 1) + 1
+    ofm_h = (ifm.get_dim_size("H") + pad_top + pad_bottom - dilated_kernel_h) // stride_h + 1
+    ofm_w = (ifm.get_dim_size("W") + pad_left + pad_right - dilated_kernel_w) // stride_w + 1
+    return [ifm.get_dim_size("N"), ofm_h, ofm_w, kernel.get_dim_size("O")]
 
 
 @pytest.mark.parametrize(
@@ -56,11 +129,14 @@ def get_shape_expr(in_expr, out_expr):
     ACCEL_TYPES,
 )
 def test_ethosu_conv2d(accel_type):
+    np.random.seed(42)
+    c1_kernel_scales = relay.const(np.random.rand(32) * 2, "float32")
+
     def create_graph_single(input_tensor_name, input_tensor_shape, input_tensor_dtype):
         c1_params = relay_ir_builder.QnnConv2DParams(input_tensor_dtype)
         c1_params.ifm.shape = input_tensor_shape
         c1_params.kernel.shape = (3, 3, c1_params.ifm.shape[3], 32)
-        c1_params.kernel.sc = relay.const(np.random.rand(32) * 2, "float32")
+        c1_params.kernel.sc = c1_kernel_scales
         c1_params.strides = (1, 1)
         c1_params.pad = "VALID"
         c1_params.update_output_qnn_params(
@@ -68,7 +144,7 @@ def test_ethosu_conv2d(accel_type):
         )
         input0 = relay.var(input_tensor_name, shape=c1_params.ifm.shape, dtype=c1_params.ifm.dtype)
         c1, new_params = relay_ir_builder.create_qnn_conv2d(c1_params, input0)
-        c1_params.ofm.shape = get_shape_expr(input0, c1)
+        c1_params.ofm.shape = conv2d_output_shape(c1_params)
 
         f = relay.Function([input0], c1)
         mod = tvm.IRModule()
@@ -86,7 +162,7 @@ def test_ethosu_conv2d(accel_type):
         )
         input0 = relay.var(input_tensor_name, shape=c1_params.ifm.shape, dtype=c1_params.ifm.dtype)
         c1, new_params = relay_ir_builder.create_qnn_conv2d(c1_params, input0)
-        c1_params.ofm.shape = get_shape_expr(input0, c1)
+        c1_params.ofm.shape = conv2d_output_shape(c1_params)
 
         c2_params = relay_ir_builder.QnnConv2DParams(input_tensor_dtype)
         c2_params.ifm.shape = c1_params.ofm.shape
@@ -95,7 +171,7 @@ def test_ethosu_conv2d(accel_type):
         c2_params.pad = "SAME"
         c2_params.update_output_qnn_params()
         c2, new_params = relay_ir_builder.create_qnn_conv2d(c2_params, c1)
-        c2_params.ofm.shape = get_shape_expr(input0, c2)
+        c2_params.ofm.shape = conv2d_output_shape(c2_params)
 
         f = relay.Function([input0], c2)
         mod = tvm.IRModule()
@@ -116,7 +192,7 @@ def test_ethosu_conv2d(accel_type):
         )
         input0 = relay.var(input_tensor_name, shape=c1_params.ifm.shape, dtype=c1_params.ifm.dtype)
         c1, new_params = relay_ir_builder.create_qnn_conv2d(c1_params, input0)
-        c1_params.ofm.shape = get_shape_expr(input0, c1)
+        c1_params.ofm.shape = conv2d_output_shape(c1_params)
 
         c2_params = relay_ir_builder.QnnConv2DParams(input_tensor_dtype)
         c2_params.ifm.shape = c1_params.ofm.shape
@@ -125,7 +201,7 @@ def test_ethosu_conv2d(accel_type):
         c2_params.pad = "SAME"
         c2_params.update_output_qnn_params()
         c2, new_params = relay_ir_builder.create_qnn_conv2d(c2_params, c1)
-        c2_params.ofm.shape = get_shape_expr(input0, c2)
+        c2_params.ofm.shape = conv2d_output_shape(c2_params)
 
         f = relay.Function([input0], c2)
         mod = tvm.IRModule()
@@ -137,36 +213,49 @@ def test_ethosu_conv2d(accel_type):
         (create_graph_double, ["input", (1, 128, 256, 4), "int8"]),
         (create_graph_activation, ["input", (1, 64, 100, 4), "int8"]),
     ]
-    np.random.seed(42)
     for test_case in test_cases:
         relay_module, conv_params = test_case[0](*test_case[1])
         input_tensor, input_shape, input_dtype = test_case[1]
-        mod = partition_for_ethosu(relay_module)
+        mod = _partition_once(partition_for_ethosu, relay_module)
 
         # Generate reference data
-        in_min, in_max = util.get_range_for_dtype_str(input_dtype)
+        in_min, in_max = _DTYPE_RANGES[input_dtype]
         input_data = {
             input_tensor: np.random.randint(
                 in_min, high=in_max, size=input_shape, dtype=input_dtype
             )
         }
-        output_data = generate_ref_data(relay_module, input_data)
+        output_data = _generate_ref_data(relay_module, input_data)
 
         compiled_models = infra.build_source(
             mod, input_data, output_data, accel_type, output_tolerance=1
         )
 
-        # Assumes only two runtime.Modules are created -- i.e. single offload module
-        ethosu_module = (
-            compiled_models[0].executor_factory.lib.imported_modules[0].imported_modules[0]
-        )
-
         # Verify generated C source
-        get_artifacts = tvm._ffi.get_global_func("runtime.module.ethos-u.get_artifacts")
-        compilation_artifacts = get_artifacts(ethosu_module)
-        cmms = bytes.fromhex(compilation_artifacts[0].command_stream)
-        infra.print_payload(cmms)
-        infra.verify_source(compiled_models, accel_type)
+        _verify_source(compiled_models, accel_type, print_cmm=PRINT_CMM)
+
+
+@lru_cache(maxsize=None)
+def _get_artifacts_func():
+    return tvm._ffi.get_global_func("runtime.module.ethos-u.get_artifacts")
+
+
+def _get_ethosu_module(compiled_models):
+    # Assumes only two runtime.Modules are created -- i.e. single offload module
+    return compiled_models[0].executor_factory.lib.imported_modules[0].imported_modules[0]
+
+
+def _get_command_stream(compiled_models):
+    compilation_artifacts = _get_artifacts_func()(_get_ethosu_module(compiled_models))
+    return bytes.fromhex(compilation_artifacts[0].command_stream)
+
+
+def _verify_source(compiled_models, accel_type, print_cmm=False):
+    """Verify the generated C source, the offloaded module is only looked up to print its
+    command stream"""
+    if print_cmm:
+        infra.print_payload(_get_command_stream(compiled_models))
+    infra.verify_source(compiled_models, accel_type)
 
 
 def _compare_ethosu_with_reference(
@@ -180,26 +269,41 @@ def _compare_ethosu_with_reference(
         output_tolerance=output_tolerance,
     )
 
-    # Assumes only two runtime.Modules are created -- i.e. single offload module
-    ethosu_module = compiled_models[0].executor_factory.lib.imported_modules[0].imported_modules[0]
-
     # Verify generated C source
-    if print_cmm:
-        get_artifacts = tvm._ffi.get_global_func("runtime.module.ethos-u.get_artifacts")
-        compilation_artifacts = get_artifacts(ethosu_module)
-        cmms = bytes.fromhex(compilation_artifacts[0].command_stream)
-        infra.print_payload(cmms)
+    _verify_source(compiled_models, accel_type, print_cmm=print_cmm)
 
-    infra.verify_source(compiled_models, accel_type)
+
+# The TFLite conversion doesn't depend on the accelerator, so the converted graphs and their
+# reference data are shared by all the accel_type parametrizations of a test
+_TFLITE_CACHE = _CaseCache()
+
+
+def _get_tflite_cache_key(tf_func, shapes, ranges):
+    """Key a TFLite conversion on the code of the function, the values it closes over and
+    the shapes and ranges of its inputs"""
+    python_function = tf_func.python_function
+    closure = python_function.__closure__ or ()
+    return (
+        python_function.__code__,
+        tuple(repr(cell.cell_contents) for cell in closure),
+        repr(shapes),
+        repr(ranges),
+    )
 
 
 def _compare_tvm_with_tflite(
     tf_func, shapes, accel_type, ranges=None, output_tolerance=0, print_cmm=False
 ):
-    mod, tflite_graph = _get_tflite_graph(tf_func, shapes, ranges)
+    def convert():
+        mod, tflite_graph = _get_tflite_graph(tf_func, shapes, ranges)
 
-    # Generate reference data
-    input_data, output_data = infra.generate_ref_data_tflite(tflite_graph)
+        # Generate reference data
+        input_data, output_data = infra.generate_ref_data_tflite(tflite_graph)
+        return mod, input_data, output_data
+
+    key = _get_tflite_cache_key(tf_func, shapes, ranges)
+    mod, input_data, output_data = _TFLITE_CACHE.get_or_create(key, convert)
+    mod = _partition_once(partition_for_ethosu, mod)
 
     _compare_ethosu_with_reference(
         mod,
@@ -218,16 +322,16 @@ def _get_tflite_graph(tf_func, shapes, ranges=None):
     concrete_func = tf_func.get_concrete_function(*tensor_specs)
 
     # Convert the model
-    def representative_dataset():
-        for _ in range(100):
-            inputs = []
-            for i, shape in enumerate(shapes):
-                data = np.random.uniform(
-                    low=ranges[i][0], high=ranges[i][1], size=tuple(shape)
-                ).astype("float32")
-                inputs.append(data)
+    calibration_data = [
+        np.random.uniform(
+            low=ranges[i][0], high=ranges[i][1], size=(NUM_CALIBRATION_SAMPLES,) + tuple(shape)
+        ).astype("float32")
+        for i, shape in enumerate(shapes)
+    ]
 
-            yield inputs
+    def representative_dataset():
+        for sample in range(NUM_CALIBRATION_SAMPLES):
+            yield [data[sample] for data in calibration_data]
 
     converter = tf.lite.TFLiteConverter.from_concrete_functions([concrete_func])
     converter.optimizations = [tf.lite.Optimize.DEFAULT]
@@ -239,13 +343,17 @@ def _get_tflite_graph(tf_func, shapes, ranges=None):
 
     tflite_model = tflite.Model.Model.GetRootAsModel(tflite_graph, 0)
 
-    relay_module, params = relay.frontend.from_tflite(tflite_model)
-    mod = partition_for_ethosu(relay_module, params)
+    mod, params = relay.frontend.from_tflite(tflite_model)
+    mod["main"] = bind_params_by_name(mod["main"], params)
     return mod, tflite_graph
 
 
 class EthosUAnnotator(ExprMutator):
-    """Annotate entire graph for Ethos-U offload"""
+    """Annotate entire graph for Ethos-U offload
+
+    relay.transform.AnnotateTarget can't be used instead, the Ethos-U operators are offloaded
+    through the pattern table rather than per operator "target.ethos-u" attributes, so it would
+    leave these graphs on the host."""
 
     def __init__(self):
         super(EthosUAnnotator, self).__init__()
@@ -273,14 +381,38 @@ class EthosUAnnotator(ExprMutator):
         return new_constant
 
 
+# The partitioned module doesn't depend on the accelerator and isn't mutated by the build, so
+# it is shared by all the accel_type parametrizations of a test
+_PARTITION_CACHE = _CaseCache()
+
+
+def _partition_once(partition_func, mod):
+    """Partition a module once per structurally unique module, the hash ignores variable
+    names so the names of the inputs are part of the key"""
+    key = (
+        partition_func,
+        tuple(param.name_hint for param in mod["main"].params),
+        tvm.ir.structural_hash(mod),
+    )
+    return _PARTITION_CACHE.get_or_create(key, lambda: partition_func(mod))
+
+
 def _create_ethosu_partition(mod):
+    return _partition_once(_annotate_and_partition, mod)
+
+
+def _annotate_and_partition(mod):
     mod["main"] = EthosUAnnotator().visit(mod["main"])
-    mod = relay.transform.MergeCompilerRegions()(mod)
-    mod = relay.transform.InferType()(mod)
-    mod = relay.transform.PartitionGraph()(mod)
-    mod = relay.transform.InferType()(mod)
-    mod = preprocess.preprocess_ext_io()(mod)
-    return mod
+    # PartitionGraph already finishes with InferType
+    seq = tvm.transform.Sequential(
+        [
+            relay.transform.MergeCompilerRegions(),
+            relay.transform.InferType(),
+            relay.transform.PartitionGraph(),
+            preprocess.preprocess_ext_io(),
+        ]
+    )
+    return seq(mod)
 
 
 @pytest.mark.parametrize("accel_type", ACCEL_TYPES)
@@ -300,10 +432,11 @@ def test_tflite_depthwise_conv2d(
     dilation,
     activation_function,
 ):
+    weight_shape = [kernel_shape[0], kernel_shape[1], ifm_shape[3], 1]
+    weight = tf.constant(np.random.uniform(size=weight_shape), dtype=tf.float32)
+
     @tf.function
     def depthwise_conv2d(x):
-        weight_shape = [kernel_shape[0], kernel_shape[1], ifm_shape[3], 1]
-        weight = tf.constant(np.random.uniform(size=weight_shape), dtype=tf.float32)
         # The input strides to the TensorFlow API needs to be of shape 1x4
         tf_strides = [1, strides[0], strides[1], 1]
         op = tf.nn.depthwise_conv2d(
@@ -335,12 +468,11 @@ def test_ethosu_pooling(
     activation_function,
     padding,
 ):
+    pool = _TF_POOLING_OPS[pooling_type]
+
     @tf.function
     def pooling(x):
-        if pooling_type == "MAX":
-            op = tf.nn.max_pool(x, pool_shape, strides, padding)
-        elif pooling_type == "AVG":
-            op = tf.nn.avg_pool(x, pool_shape, strides, padding)
+        op = pool(x, pool_shape, strides, padding)
         if activation_function == "RELU":
             op = tf.nn.relu(op)
         return op
@@ -367,18 +499,11 @@ def test_ethosu_binary_elementwise(
     ifm2_shape,
     activation_function,
 ):
+    binary_op = _TF_BINARY_OPS[operator_type]
+
     @tf.function
     def binary_elementwise(lhs, rhs):
-        if operator_type == "ADD":
-            op = tf.math.add(lhs, rhs)
-        elif operator_type == "SUB":
-            op = tf.math.subtract(lhs, rhs)
-        elif operator_type == "MUL":
-            op = tf.math.multiply(lhs, rhs)
-        elif operator_type == "MIN":
-            op = tf.math.minimum(lhs, rhs)
-        elif operator_type == "MAX":
-            op = tf.math.maximum(lhs, rhs)
+        op = binary_op(lhs, rhs)
         if activation_function == "RELU":
             op = tf.nn.relu(op)
         return op
@@ -455,10 +580,11 @@ def test_mean(accel_type, ifm_shape, axis, keep_dims, use_same_quantization):
         )
 
         # Convert the model
+        calibration_data = np.random.rand(NUM_CALIBRATION_SAMPLES, *ifm_shape).astype(np.float32)
+
         def representative_dataset():
-            for _ in range(100):
-                data = np.random.rand(*tuple(ifm_shape))
-                yield [data.astype(np.float32)]
+            for data in calibration_data:
+                yield [data]
 
         converter = tf.lite.TFLiteConverter.from_concrete_functions([concrete_func])
         converter.optimizations = [tf.lite.Optimize.DEFAULT]
@@ -493,13 +619,15 @@ def test_mean(accel_type, ifm_shape, axis, keep_dims, use_same_quantization):
         mod = tvm.IRModule.from_expr(func)
 
         input_data = {"input": np.random.randint(low=-127, high=128, size=ifm_shape, dtype=dtype)}
-        output_data = generate_ref_data(mod, input_data)
+        output_data = _generate_ref_data(mod, input_data)
         return mod, input_data, output_data
 
-    mod, input_data, output_data = (
-        create_mod_from_relay() if use_same_quantization else create_mod_from_tflite()
-    )
-    mod = partition_for_ethosu(mod)
+    if use_same_quantization:
+        mod, input_data, output_data = create_mod_from_relay()
+    else:
+        key = (test_mean.__name__, tuple(ifm_shape), axis, keep_dims)
+        mod, input_data, output_data = _TFLITE_CACHE.get_or_create(key, create_mod_from_tflite)
+    mod = _partition_once(partition_for_ethosu, mod)
 
     # TODO(lhutton1) For now output is not bit exact with TFLite.
     # This is because TFLite reference kernels are not being used.
@@ -508,15 +636,8 @@ def test_mean(accel_type, ifm_shape, axis, keep_dims, use_same_quantization):
         mod, input_data, output_data, accel_type, output_tolerance=1
     )
 
-    # Assumes only two runtime.Modules are created -- i.e. single offload module
-    ethosu_module = compiled_models[0].executor_factory.lib.imported_modules[0].imported_modules[0]
-
     # Verify generated C source
-    get_artifacts = tvm._ffi.get_global_func("runtime.module.ethos-u.get_artifacts")
-    compilation_artifacts = get_artifacts(ethosu_module)
-    cmms = bytes.fromhex(compilation_artifacts[0].command_stream)
-    infra.print_payload(cmms)
-    infra.verify_source(compiled_models, accel_type)
+    _verify_source(compiled_models, accel_type, print_cmm=PRINT_CMM)
 
 
 @pytest.mark.parametrize("accel_type", ACCEL_TYPES)
@@ -540,7 +661,7 @@ def test_elementwise_add_from_constant_scalar(accel_type, dtype):
         return tvm.IRModule.from_expr(relay.Function(relay.analysis.free_vars(add), add))
 
     cpu_mod = create_relay_graph()
-    ethosu_mod = partition_for_ethosu(cpu_mod)
+    ethosu_mod = _partition_once(partition_for_ethosu, cpu_mod)
 
     # Generate reference data
     input_data = {
@@ -548,7 +669,7 @@ def test_elementwise_add_from_constant_scalar(accel_type, dtype):
             low=np.iinfo(dtype).min, high=np.iinfo(dtype).max, size=ifm_shape, dtype=dtype
         ),
     }
-    output_data = generate_ref_data(cpu_mod, input_data)
+    output_data = _generate_ref_data(cpu_mod, input_data)
 
     _compare_ethosu_with_reference(
         ethosu_mod, input_data, output_data, accel_type, output_tolerance=0
@@ -580,13 +701,13 @@ def test_ethosu_left_shift_binary_elemwise(
     cpu_mod = create_model()
 
     # Generate reference data
-    in_min, in_max = util.get_range_for_dtype_str(dtype)
+    in_min, in_max = _DTYPE_RANGES[dtype]
     input_data = {
         "ifm": np.random.randint(in_min, high=in_max, size=ifm_shape, dtype=dtype),
         "ifm2": np.random.randint(0, high=32, size=ifm2_shape, dtype=dtype),
     }
-    output_data = generate_ref_data(cpu_mod, input_data)
-    ethosu_mod = partition_for_ethosu(cpu_mod)
+    output_data = _generate_ref_data(cpu_mod, input_data)
+    ethosu_mod = _partition_once(partition_for_ethosu, cpu_mod)
 
     _compare_ethosu_with_reference(
         ethosu_mod, input_data, output_data, accel_type, output_tolerance=0
@@ -619,25 +740,15 @@ def test_ethosu_right_shift_binary_elemwise(
         lhs = input_data["ifm"]
         rhs = input_data["ifm2"]
         if reversed_operands:
-            lhs = np.broadcast_to(lhs, ifm2_shape)
             lhs, rhs = rhs, lhs
-        else:
-            rhs = np.broadcast_to(rhs, ifm_shape)
 
-        def rounding_right_shift(lhs, rhs):
-            r = 1 << (rhs - 1)
-            return (lhs + r) >> rhs
-
-        return [
-            np.array([rounding_right_shift(x[0], x[1]) for x in zip(lhs.flat, rhs.flat)]).astype(
-                ofm_dtype
-            )
-        ]
+        # Rounding right shift, the operands are broadcast by the arithmetic itself
+        r = 1 << (rhs - 1)
+        return [((lhs + r) >> rhs).ravel().astype(ofm_dtype)]
 
     cpu_mod = create_model()
 
     # Generate reference data
-    in_min, in_max = util.get_range_for_dtype_str(dtype)
     in_min, in_max = 18, 19
     lhs = np.random.randint(in_min, high=in_max, size=ifm_shape, dtype=dtype)
     rhs = np.random.randint(1, high=2, size=ifm2_shape, dtype=dtype)
@@ -701,7 +812,7 @@ def test_relay_reshape_codegen(ifm_shape, new_shape, accel_type):
 
     cpu_mod = create_model()
     input_data = {"ifm": np.random.randint(-128, high=127, size=ifm_shape, dtype="int8")}
-    output_data = generate_ref_data(cpu_mod, input_data)
+    output_data = _generate_ref_data(cpu_mod, input_data)
     ethosu_mod = _create_ethosu_partition(cpu_mod)
 
     _compare_ethosu_with_reference(ethosu_mod, input_data, output_data, accel_type)
@@ -725,7 +836,7 @@ def test_relay_strided_slice_codegen(ifm_shape, begin, end, accel_type):
 
     cpu_mod = create_model()
     input_data = {"ifm": np.random.randint(-128, high=127, size=ifm_shape, dtype="int8")}
-    output_data = generate_ref_data(cpu_mod, input_data)
+    output_data = _generate_ref_data(cpu_mod, input_data)
     ethosu_mod = _create_ethosu_partition(cpu_mod)
 
     _compare_ethosu_with_reference(ethosu_mod, input_data, output_data, accel_type)
@@ -742,36 +853,35 @@ def test_ethosu_unary_elementwise(
     operator_type,
     ifm_shape,
 ):
+    unary_op = _TF_UNARY_OPS[operator_type]
+
     @tf.function
-    def abs_func(x):
-        if operator_type == "ABS":
-            op = tf.math.abs(x)
-        return op
+    def unary_elementwise(x):
+        return unary_op(x)
 
-    _compare_tvm_with_tflite(abs_func, [ifm_shape], accel_type)
+    _compare_tvm_with_tflite(unary_elementwise, [ifm_shape], accel_type)
 
 
 def test_ethosu_section_name():
+    weight_shape = [3, 3, 3, 1]
+    weight = tf.constant(np.random.uniform(size=weight_shape), dtype=tf.float32)
+
     @tf.function
     def depthwise_conv2d(x):
-        weight_shape = [3, 3, 3, 1]
-        weight = tf.constant(np.random.uniform(size=weight_shape), dtype=tf.float32)
         tf_strides = [1, 1, 1, 1]
         op = tf.nn.depthwise_conv2d(x, weight, strides=tf_strides, padding="SAME", dilations=(2, 2))
         return op
 
     mod, tflite_graph = _get_tflite_graph(depthwise_conv2d, [(1, 55, 55, 3)])
+    mod = partition_for_ethosu(mod)
 
     # Generate reference data
     input_data, output_data = infra.generate_ref_data_tflite(tflite_graph)
 
     compiled_models = infra.build_source(mod, input_data, output_data)
 
-    # Assumes only two runtime.Modules are created -- i.e. single offload module
-    ethosu_module = compiled_models[0].executor_factory.lib.imported_modules[0].imported_modules[0]
-
     # Verify generated C source
-    source = ethosu_module.get_source()
+    source = _get_ethosu_module(compiled_models).get_source()
     assert (
         '__attribute__((section(".rodata.tvm"), aligned(16))) static int8_t tvmgen_default_ethos_u_main_0_cms_data_data'
         in source
@@ -792,18 +902,11 @@ def test_ethosu_clz(accel_type):
         return tvm.IRModule.from_expr(relay.Function([ifm], clz))
 
     def generate_output_data(input_data):
-        def clz_comp(n):
-            n_bin = np.binary_repr(n)
-            if n_bin[0] == "-":
-                return 0
-            else:
-                return 32 - len(n_bin)
-
-        return [
-            np.array([clz_comp(i) for i in input_data["ifm"].ravel()])
-            .reshape(ifm_shape)
-            .astype("int32")
-        ]
+        ifm = input_data["ifm"]
+        # The exponent returned by frexp is the bit length of the positive values,
+        # negative values have no leading zeros and 0 is counted like 1
+        bit_length = np.frexp(np.maximum(ifm, 1))[1]
+        return [np.where(ifm < 0, 0, 32 - bit_length).astype("int32")]
 
     cpu_mod = create_model()
     input_data = {"ifm": np.random.randint(-500000, high=500000, size=ifm_shape, dtype="int32")}
@@ -16,6 +16,8 @@
 # under the License.
 # pylint: disable=invalid-name, unused-argument
 
+import math
+
 import pytest
 
 pytest.importorskip("ethosu.vela")
@@ -29,6 +31,7 @@ from tvm.relay.backend.contrib.ethosu import legalize, preprocess
 from tvm.relay import dataflow_pattern
 from tvm.relay.op.contrib import ethosu
 from tvm.relay.backend.contrib.ethosu import util
+from tvm.relay.backend.contrib.ethosu import vela_api
 from tvm.relay.build_module import bind_params_by_name
 
 from . import relay_ir_builder
@@ -755,6 +758,48 @@ def test_binary_add_from_constant_scalar():
     verify(mod["tvmgen_default_ethos_u_main_0"])
 
 
+def test_binary_elementwise_legalize_pass():
+    dtype = "uint8"
+    ifm_shape = (1, 4, 4, 8)
+
+    def create_graph():
+        inp = relay.var("input", shape=ifm_shape, dtype=dtype)
+        scalar = relay.const(np.ones((1, 1, 1, 1), dtype=dtype), dtype=dtype)
+        qnn_params = [relay.const(1.0, dtype="float32"), relay.const(0, dtype="int32")] * 3
+        add = relay.qnn.op.add(inp, scalar, *qnn_params)
+        sub = relay.qnn.op.subtract(add, scalar, *qnn_params)
+        func = relay.Function(relay.analysis.free_vars(sub), sub)
+        return tvm.IRModule.from_expr(func)
+
+    def verify(ext_func):
+        sub = ext_func.body
+        assert sub.op.name == "contrib.ethosu.binary_elementwise"
+        assert sub.attrs.operator_type == "SUB"
+        add = sub.args[0]
+        assert add.op.name == "contrib.ethosu.binary_elementwise"
+        assert add.attrs.operator_type == "ADD"
+
+    pattern_table = [
+        (
+            ethosu.AddParams.composite_name,
+            ethosu.qnn_add_pattern(),
+            lambda pat: ethosu.AddParams(pat).is_valid(),
+        ),
+        (
+            ethosu.SubParams.composite_name,
+            ethosu.qnn_subtract_pattern(),
+            lambda pat: ethosu.SubParams(pat).is_valid(),
+        ),
+    ]
+
+    mod = create_graph()
+    mod = partition_ethosu_by_table(mod, pattern_table)
+
+    mod = legalize.LegalizeBinaryElementwise()(mod)
+    mod = relay.transform.InferType()(mod)
+    verify(mod["tvmgen_default_ethos_u_main_0"])
+
+
 @pytest.mark.parametrize(
     "ifm_shape, ifm2_shape, reversed_operands",
     [
@@ -856,6 +901,40 @@ def test_relay_reshape_legalize(ifm_shape, new_shape):
     assert tuple(identity.checked_type.shape) == new_shape
 
 
+def test_relay_identity_reshape_legalize():
+    ifm = relay.var("ifm", shape=(1, 4, 1, 2), dtype="int8")
+    reshape = relay.op.reshape(ifm, (4, 2))
+    identity_reshape = relay.op.reshape(reshape, (4, 2))
+    func = relay.Function([ifm], identity_reshape)
+    mod = tvm.IRModule()
+    mod["main"] = func
+    mod = relay.transform.InferType()(mod)
+
+    reshape_pattern_table = [
+        (
+            ethosu.ReshapeParams.composite_name,
+            ethosu.reshape_pattern(),
+            lambda pat: ethosu.ReshapeParams(pat).is_valid(),
+        ),
+    ]
+
+    mod = partition_ethosu_by_table(mod, reshape_pattern_table)
+    mod = legalize.LegalizeReshape()(mod)
+    mod = legalize.LegalizeNoOps()(mod)
+    mod = relay.transform.InferType()(mod)
+
+    ext_func = mod["tvmgen_default_ethos_u_main_0"]
+
+    identity = ext_func.body
+    assert identity.op.name == "contrib.ethosu.identity"
+
+    # check that only the reshape of the function input is left
+    reshape = identity.args[0]
+    assert reshape.op.name == "reshape"
+    assert isinstance(reshape.args[0], relay.Var)
+    assert tuple(identity.checked_type.shape) == (4, 2)
+
+
 @pytest.mark.parametrize(
     "ifm_shape, begin, end",
     [
@@ -1219,6 +1298,64 @@ def test_mean(ifm_shape, axis, keep_dims, use_same_quantization):
     verify(mod["tvmgen_default_ethos_u_main_0"])
 
 
+def test_mean_legalize_shares_weights():
+    ifm_shape = (1, 4, 6, 3)
+    dtype = "int8"
+
+    def create_mean(name):
+        ifm = relay.var(name, shape=ifm_shape, dtype=dtype)
+        cast = relay.cast(ifm, dtype="int32")
+        mean = relay.mean(cast, axis=[1, 2], keepdims=True)
+        return relay.qnn.op.requantize(
+            mean,
+            input_scale=relay.const(0.25, dtype="float32"),
+            input_zero_point=relay.const(2, dtype="int32"),
+            output_scale=relay.const(0.5, dtype="float32"),
+            output_zero_point=relay.const(3, dtype="int32"),
+            out_dtype=dtype,
+        )
+
+    out = relay.Tuple([create_mean("ifm"), create_mean("ifm2")])
+    mod = tvm.IRModule.from_expr(relay.Function(relay.analysis.free_vars(out), out))
+    pattern_table = [
+        (
+            ethosu.MeanParams.composite_name,
+            ethosu.mean_pattern(),
+            lambda pat: ethosu.MeanParams(pat).is_valid(),
+        ),
+    ]
+    mod = relay.transform.MergeComposite(pattern_table)(mod)
+    mod = relay.transform.InferType()(mod)
+
+    rewriter = legalize.MeanRewriter()
+    func = dataflow_pattern.rewrite(rewriter, mod["main"])
+
+    depthwise_ops = []
+
+    def collect_depthwise(expr):
+        if util.is_named_ethosu_op(expr, "depthwise_conv2d"):
+            depthwise_ops.append(expr)
+
+    relay.analysis.post_order_visit(func, collect_depthwise)
+    assert len(depthwise_ops) == 2
+    assert len(rewriter.weights_cache) == 1
+
+    # The shared scale and bias are packed exactly like the float32 scales of the graph
+    expected_scale_bias = vela_api.pack_biases(
+        biases=np.zeros(ifm_shape[-1]),
+        ifm_scale=np.array(0.25, dtype="float32"),
+        ifm_dtype=np.dtype(dtype),
+        weight_scales=np.array([1], dtype=np.float64),
+        ofm_scale=np.array(0.5, dtype="float32"),
+        is_activation_tanh_or_sigmoid=False,
+    )
+    for depthwise_op in depthwise_ops:
+        weight, scale_bias = depthwise_op.args[1], depthwise_op.args[2]
+        assert (weight.data.numpy() == 1).all()
+        assert weight.data.dtype == dtype
+        np.testing.assert_array_equal(scale_bias.data.numpy(), expected_scale_bias)
+
+
 @pytest.mark.parametrize(
     "shapes, axis",
     [
@@ -1350,5 +1487,42 @@ def test_tflite_sigmoid_legalize():
     assert tuple(func_body.args[1].checked_type.shape) == (256,)
 
 
+@pytest.mark.parametrize(
+    "calc_func, np_calc_func",
+    [
+        (math.tanh, np.tanh),
+        (legalize.sigmoid_calc_func, legalize.np_sigmoid_calc_func),
+    ],
+)
+@pytest.mark.parametrize(
+    "ifm_scale, ifm_zp, ofm_scale, ofm_zp",
+    [
+        # The tanh outputs saturate at both ends of the int8 range
+        (0.1, 0, 1 / 128, 0),
+        (0.05, 10, 0.006, -5),
+        # The inputs reach the sigmoid limits
+        (0.0625, -3, 1 / 256, -128),
+        (0.2, 0, 0.004, -128),
+    ],
+)
+def test_lut_from_func_matches_scalar_computation(
+    calc_func, np_calc_func, ifm_scale, ifm_zp, ofm_scale, ofm_zp
+):
+    # The LUT as computed one int8 value at a time
+    expected_lut = []
+    for x in range(-128, 128):
+        out_real = calc_func(ifm_scale * (x - ifm_zp))
+        lut_result = int(util.round_away_zero(ofm_zp + out_real / ofm_scale))
+        expected_lut.append(min(127, max(-128, lut_result)))
+
+    for lut_values in [
+        legalize.get_lut_from_func(ifm_scale, ifm_zp, ofm_scale, ofm_zp, calc_func, np_calc_func),
+        legalize.get_lut_from_func(ifm_scale, ifm_zp, ofm_scale, ofm_zp, calc_func),
+        legalize._get_cached_lut(ifm_scale, ifm_zp, ofm_scale, ofm_zp, calc_func, np_calc_func),
+    ]:
+        assert lut_values.dtype == np.uint8
+        np.testing.assert_array_equal(lut_values.view(np.int8), expected_lut)
+
+
 if __name__ == "__main__":
     pytest.main([__file__])